@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Measures a ComponentManager under contention from many threads.
+
+    $ python bench/contention.py [seconds] [max_threads]
+
+Each thread repeatedly looks up the extensions of an interface through a
+restricted ComponentManager and activates a Component directly.  The
+run is repeated with a doubling number of threads, first on its own and
+then with a writer thread changing the policy as fast as it can.  The
+throughput and the 50th, 90th and 99th percentile latency of a single
+lookup are reported for each run.
+"""
+import sys
+import threading
+import time
+
+from giblets import Component, ComponentManager, ExtensionInterface, implements
+from giblets.policy import Blacklist
+
+class IStep(ExtensionInterface):
+    pass
+
+def define_steps(count):
+    steps = []
+    for i in range(count):
+        class Step(Component):
+            implements(IStep)
+        Step.__name__ = 'Step%d' % i
+        steps.append(Step)
+    return steps
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+def run(mgr, steps, policy, threads, seconds, writer):
+    done = threading.Event()
+    timings = [[] for i in range(threads)]
+
+    def look(index):
+        samples = timings[index]
+        step = steps[index % len(steps)]
+        while not done.is_set():
+            start = time.time()
+            mgr.get_all(IStep)
+            step(mgr)
+            samples.append(time.time() - start)
+
+    def write():
+        toggled = steps[-1]
+        while not done.is_set():
+            policy.disable_component(toggled)
+            policy.enable_component(toggled)
+
+    workers = [threading.Thread(target=look, args=(i,)) for i in range(threads)]
+    if writer:
+        workers.append(threading.Thread(target=write))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    done.set()
+    for worker in workers:
+        worker.join()
+
+    samples = sorted(s for per_thread in timings for s in per_thread)
+    return (len(samples) / seconds,
+            percentile(samples, 0.50) * 1e6,
+            percentile(samples, 0.90) * 1e6,
+            percentile(samples, 0.99) * 1e6)
+
+def main(argv):
+    seconds = float(argv[1]) if len(argv) > 1 else 1.0
+    max_threads = int(argv[2]) if len(argv) > 2 else 32
+    steps = define_steps(20)
+    policy = Blacklist()
+    mgr = ComponentManager()
+    mgr.restrict(policy)
+
+    for writer in (False, True):
+        print "lookups %s" % ('with a policy writer' if writer else 'only')
+        print "  threads      ops/s    p50 us    p90 us    p99 us"
+        threads = 1
+        while threads <= max_threads:
+            ops, p50, p90, p99 = run(mgr, steps, policy, threads, seconds, writer)
+            print "  %7d %10.0f %9.1f %9.1f %9.1f" % (threads, ops, p50, p90, p99)
+            threads *= 2
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
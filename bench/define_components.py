@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Compares ways of defining many Components at once.
+
+    $ python bench/define_components.py [components] [runs]
+
+Each run defines the given number of Components implementing an
+interface, with an ExtensionPoint queried between definitions (as
+happens when plugins are loaded into a running application), either
+one class statement at a time, inside deferred_registration, or with
+define_components.  The best of several runs is reported.
+"""
+import sys
+import time
+
+from giblets import *
+from giblets.core import ComponentMeta
+
+class IColumn(ExtensionInterface):
+    pass
+
+def one_at_a_time(count, mgr):
+    for i in range(count):
+        class Column(Component):
+            implements(IColumn)
+        mgr.get_all(IColumn)
+
+def deferred(count, mgr):
+    with deferred_registration():
+        for i in range(count):
+            class Column(Component):
+                implements(IColumn)
+            mgr.get_all(IColumn)
+
+def defined(count, mgr):
+    define_components([('Column%d' % i, (Component,), {}, [IColumn])
+                       for i in range(count)])
+    mgr.get_all(IColumn)
+
+def best_of(runs, count, define):
+    best = None
+    for i in range(runs):
+        ComponentMeta._registries = {}
+        mgr = ComponentManager()
+        start = time.time()
+        define(count, mgr)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    print "%d components, best of %d runs" % (count, runs)
+    for define in (one_at_a_time, deferred, defined):
+        print "  %-16s %8.1f ms" % (define.__name__, best_of(runs, count, define) * 1000.0)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
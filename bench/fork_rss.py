@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Measures how much memory each forked worker stops sharing with its 
+parent, with and without ComponentManager.prepare_for_fork.
+
+    $ python bench/fork_rss.py [components] [workers]
+
+Linux only, reads /proc/<pid>/smaps.
+"""
+import os
+import sys
+
+from giblets import Component, ComponentManager, ExtensionInterface, implements
+
+class IHeavy(ExtensionInterface):
+    pass
+
+def make_component(i):
+    class Heavy(Component):
+        implements(IHeavy)
+        def __init__(self):
+            self.table = dict((str(j), [j] * 4) for j in range(200))
+    Heavy.__name__ = 'Heavy%d' % i
+    return Heavy
+
+def private_dirty_kb(pid):
+    total = 0
+    for line in open('/proc/%d/smaps' % pid):
+        if line.startswith('Private_Dirty:'):
+            total += int(line.split()[1])
+    return total
+
+def run(prepare, count, workers):
+    mgr = ComponentManager()
+    if prepare:
+        mgr.prepare_for_fork(interfaces=[IHeavy])
+
+    results = []
+    for i in range(workers):
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            if prepare:
+                # without gc.freeze, keeping the collector away from
+                # the shared objects is up to the worker.
+                mgr.after_fork(gc_threshold=0)
+            # a worker's typical traffic: walk the extensions and
+            # allocate enough to set off full collections.
+            for x in range(10):
+                for heavy in mgr.get_all(IHeavy):
+                    len(heavy.table)
+            junk = [{} for x in range(200000)]
+            os.write(w, str(private_dirty_kb(os.getpid())))
+            os._exit(0)
+        os.close(w)
+        results.append(int(os.read(r, 64)))
+        os.close(r)
+        os.waitpid(pid, 0)
+    return sum(results) / float(len(results))
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    workers = int(argv[2]) if len(argv) > 2 else 4
+    for i in range(count):
+        make_component(i)
+    # prepare_for_fork may freeze the collector for good, so it goes last.
+    plain = run(False, count, workers)
+    prepared = run(True, count, workers)
+    print "components: %d workers: %d" % (count, workers)
+    print "private dirty per worker, plain:            %8.0f kB" % plain
+    print "private dirty per worker, prepare_for_fork: %8.0f kB" % prepared
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Checks the time taken by 'import giblets, giblets.policy' against 
+a budget relative to a reference measured in the same run.
+
+    $ python bench/import_time.py [baseline] [runs]
+
+baseline is another giblets tree to compare with, either a directory 
+or a git revision of this repository (exported to a temporary 
+directory), eg. the last release.  The budget is then 10% over the 
+time the baseline takes to import.  Without a baseline, the reference 
+is the set of modules giblets can't avoid importing (zope.interface 
+and a few builtins), and the budget is a fixed multiple of its time.
+
+Each cost is the best of several runs of a fresh interpreter, less the 
+best run of one that imports nothing.  The runs of each statement are 
+interleaved so that the machine getting faster or slower during the 
+check affects them all alike.
+
+On interpreters supporting -X importtime (Python 3.7 and later, not 
+Python 2.7), the slowest modules are listed as well; elsewhere the 
+modules that giblets imports are listed instead.  Exits with status 1 
+if the budget is exceeded.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+STATEMENT = 'import giblets, giblets.policy'
+# what giblets imports no matter how lean it is.
+REFERENCE = 'import gc, thread, time, weakref, zope.interface'
+# 'import giblets, giblets.policy' took about 1.4 times as long as 
+# REFERENCE before the features added since (interface backends, 
+# thread-safe activation, ...); the budget allows 10% on top of that.
+REFERENCE_BUDGET = 1.55
+# allowed over a baseline tree.
+BASELINE_BUDGET = 1.1
+
+def best_of(runs, commands):
+    """
+    the best time of each command over runs rounds, running each 
+    command once per round.
+    """
+    best = [None] * len(commands)
+    for i in range(runs):
+        for index, (statement, env) in enumerate(commands):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', statement], env=env)
+            elapsed = time.time() - start
+            if best[index] is None or elapsed < best[index]:
+                best[index] = elapsed
+    return best
+
+def with_path(path):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = path + os.pathsep + os.environ.get('PYTHONPATH', '')
+    return env
+
+def export_revision(here, revision):
+    """
+    a temporary directory holding the tree of the git revision given.
+    """
+    tree = tempfile.mkdtemp()
+    archive = subprocess.Popen(['git', 'archive', revision], cwd=here, 
+                               stdout=subprocess.PIPE)
+    untar = subprocess.call(['tar', '-x', '-C', tree], stdin=archive.stdout)
+    archive.stdout.close()
+    if archive.wait() != 0 or untar != 0:
+        shutil.rmtree(tree)
+        raise ValueError('unable to export revision %s' % revision)
+    return tree
+
+def importtime_report(env, limit=10):
+    try:
+        proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', STATEMENT],
+                                stderr=subprocess.PIPE, env=env)
+        out, err = proc.communicate()
+    except OSError:
+        return None
+    if proc.returncode != 0 or 'import time:' not in err:
+        return None
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+def imported_modules(env):
+    script = ("import sys; before = set(sys.modules); %s; "
+              "print(' '.join(sorted(m for m in sys.modules "
+              "if sys.modules[m] is not None and m not in before)))" % STATEMENT)
+    proc = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, env=env)
+    out, err = proc.communicate()
+    return out.split()
+
+def main(argv):
+    baseline = argv[1] if len(argv) > 1 else None
+    runs = int(argv[2]) if len(argv) > 2 else 10
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = with_path(here)
+
+    exported = None
+    if baseline is None:
+        reference = (REFERENCE, env)
+        budget = REFERENCE_BUDGET
+        label = 'the reference modules'
+    else:
+        if not os.path.isdir(baseline):
+            try:
+                baseline = exported = export_revision(here, baseline)
+            except ValueError, e:
+                print >>sys.stderr, e
+                return 2
+        reference = (STATEMENT, with_path(os.path.abspath(baseline)))
+        budget = BASELINE_BUDGET
+        label = 'the baseline'
+    try:
+        nothing, reference_time, giblets_time = best_of(runs, [('pass', env), reference, 
+                                                               (STATEMENT, env)])
+    finally:
+        if exported is not None:
+            shutil.rmtree(exported)
+    cost = (giblets_time - nothing) * 1000.0
+    reference_cost = (reference_time - nothing) * 1000.0
+    limit = reference_cost * budget
+    print "import giblets, giblets.policy: %.1f ms, %s: %.1f ms (budget %.1f ms)" % \
+          (cost, label, reference_cost, limit)
+
+    report = importtime_report(env)
+    if report:
+        print "slowest imports (cumulative us, self us, module):"
+        for cumulative, self_us, name in report:
+            print "  %8d %8d %s" % (cumulative, self_us, name)
+    else:
+        print "modules imported (-X importtime is not available):"
+        for name in imported_modules(env):
+            print "  %s" % name
+
+    if cost > limit:
+        print "over budget"
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
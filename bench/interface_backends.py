@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Compares the zope and native interface backends.
+
+    $ python bench/interface_backends.py [components] [runs]
+
+For each backend a fresh interpreter imports giblets, defines a
+hierarchy of interfaces and the given number of Components
+implementing them, then queries implemented_by for each of them and
+collects every implementor through an ExtensionPoint.  The best of
+several runs is reported for each step.
+"""
+import os
+import subprocess
+import sys
+
+BACKENDS = ['zope', 'native']
+
+SCRIPT = r"""
+import sys, time
+start = time.time()
+from giblets import *
+imported = time.time()
+
+class IBase(ExtensionInterface): pass
+class IPart(IBase): pass
+class IBall(IBase): pass
+classes = []
+for i in range(%(components)d):
+    class Part(Component):
+        implements(IPart, IBall)
+    Part.__name__ = 'Part%%d' %% i
+    classes.append(Part)
+defined = time.time()
+
+for cls in classes:
+    implemented_by(cls)
+queried = time.time()
+
+class Parts(Component):
+    parts = ExtensionPoint(IBase)
+assert len(Parts(ComponentManager()).parts) == len(classes)
+collected = time.time()
+
+print '%%f %%f %%f %%f' %% (imported - start, defined - imported,
+                        queried - defined, collected - queried)
+"""
+
+STEPS = ['import', 'define', 'implemented_by', 'extension point']
+
+def run(backend, components):
+    env = dict(os.environ)
+    env['GIBLETS_INTERFACE_BACKEND'] = backend
+    proc = subprocess.Popen([sys.executable, '-c', SCRIPT % {'components': components}],
+                            stdout=subprocess.PIPE, env=env)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit('%s backend failed' % backend)
+    return [float(x) for x in out.split()]
+
+def main(argv):
+    components = int(argv[1]) if len(argv) > 1 else 1000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.environ['PYTHONPATH'] = here + os.pathsep + os.environ.get('PYTHONPATH', '')
+
+    print "%d components, best of %d runs (ms)" % (components, runs)
+    print "%-16s" % 'backend' + ''.join("%18s" % step for step in STEPS)
+    for backend in BACKENDS:
+        best = None
+        for i in range(runs):
+            times = run(backend, components)
+            if best is None:
+                best = times
+            else:
+                best = [min(a, b) for a, b in zip(best, times)]
+        print "%-16s" % backend + ''.join("%18.1f" % (t * 1000.0) for t in best)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Times find_plugins_in_tree on a generated plugin tree.
+
+    $ python bench/tree_scan.py [files] [files_per_dir]
+
+Builds a temporary tree of plugin modules, each defining a Component,
+then reports the time taken to load it all, to scan it again when
+nothing has changed, and to pick up a single new file.  The time to
+list every directory with and without scandir is reported as well.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from giblets import search
+
+PLUGIN_SOURCE = """
+from giblets import Component
+class Plugin%d(Component):
+    pass
+"""
+
+def build_tree(root, files, per_dir):
+    dirs = []
+    for i in range(files):
+        group, index = divmod(i, per_dir)
+        path = os.path.join(root, 'group%d' % (group // 10), 'part%d' % group)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+            dirs.append(path)
+        f = open(os.path.join(path, 'plugin%d.py' % i), 'w')
+        f.write(PLUGIN_SOURCE % i)
+        f.close()
+    return dirs
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    return (time.time() - start) * 1000.0
+
+def list_all(dirs):
+    for path in dirs:
+        search._list_dir(path)
+
+def main(argv):
+    files = int(argv[1]) if len(argv) > 1 else 20000
+    per_dir = int(argv[2]) if len(argv) > 2 else 100
+    root = tempfile.mkdtemp()
+    try:
+        dirs = build_tree(root, files, per_dir)
+        print "%d files in %d directories" % (files, len(dirs))
+
+        if search._scandir is not None:
+            print "  list with scandir   %10.1f ms" % timed(list_all, dirs)
+        scandir, search._scandir = search._scandir, None
+        print "  list with listdir   %10.1f ms" % timed(list_all, dirs)
+        search._scandir = scandir
+
+        print "  first load          %10.1f ms" % timed(search.find_plugins_in_tree, root,
+                                                        package='bench_tree')
+        print "  unchanged rescan    %10.1f ms" % timed(search.find_plugins_in_tree, root,
+                                                        package='bench_tree')
+        f = open(os.path.join(dirs[-1], 'extra.py'), 'w')
+        f.write(PLUGIN_SOURCE % files)
+        f.close()
+        os.utime(dirs[-1], (1000000000, 1000000000))
+        print "  rescan with new file%10.1f ms" % timed(search.find_plugins_in_tree, root,
+                                                        package='bench_tree')
+    finally:
+        shutil.rmtree(root)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
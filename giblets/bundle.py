@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Builds plugin bundles, zip archives of precompiled plugin modules that
+giblets.search.find_plugins_in_bundle loads with zipimport.
+
+    $ python -m giblets.bundle /path/to/plugins /path/to/plugins.zip
+
+The bytecode is specific to the version of Python that built it, so
+bundles should be built with the same Python that will load them.
+"""
+import os
+import py_compile
+import shutil
+import sys
+import tempfile
+import zipfile
+
+__all__ = ['build_bundle']
+
+def build_bundle(plugin_dir, bundle_path, sources=False):
+    """
+    compile each .py file in plugin_dir and write the bytecode to the
+    zip archive bundle_path, replacing it once it is complete.  If
+    sources is True, the source files are included as well.
+
+    returns the names of the modules in the bundle.  Raises
+    py_compile.PyCompileError if any of the files fail to compile.
+    """
+    names = sorted(name for name in os.listdir(plugin_dir)
+                   if name.endswith('.py') and
+                   os.path.isfile(os.path.join(plugin_dir, name)))
+    bundle_dir = os.path.dirname(os.path.abspath(bundle_path))
+    build_dir = tempfile.mkdtemp()
+    try:
+        fd, tmp_bundle = tempfile.mkstemp(suffix='.zip', dir=bundle_dir)
+        os.close(fd)
+        try:
+            archive = zipfile.ZipFile(tmp_bundle, 'w', zipfile.ZIP_DEFLATED)
+            try:
+                for name in names:
+                    py_file = os.path.join(plugin_dir, name)
+                    compiled = os.path.join(build_dir, name + 'c')
+                    py_compile.compile(py_file, compiled,
+                                       os.path.join(bundle_path, name), True)
+                    archive.write(compiled, name + 'c')
+                    if sources:
+                        archive.write(py_file, name)
+            finally:
+                archive.close()
+            # mkstemp leaves the file readable by its owner only, give 
+            # it the permissions of any other new file.
+            os.chmod(tmp_bundle, 0666 & ~_umask())
+            os.rename(tmp_bundle, bundle_path)
+        except:
+            os.remove(tmp_bundle)
+            raise
+    finally:
+        shutil.rmtree(build_dir)
+    return [name[:-3] for name in names]
+
+def _umask():
+    # the umask can only be read by setting it.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def main(argv):
+    if len(argv) != 3:
+        print >>sys.stderr, "usage: python -m giblets.bundle <plugin dir> <bundle>"
+        return 2
+    try:
+        modules = build_bundle(argv[1], argv[2])
+    except (py_compile.PyCompileError, EnvironmentError), e:
+        print >>sys.stderr, "unable to build %s: %s" % (argv[2], e)
+        return 1
+    print "%s: %d modules" % (argv[2], len(modules))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -18,13 +18,32 @@
 #         Christopher Lenz <cmlenz@gmx.de>
 
 
-from zope import interface as zi
-from zope.interface import Attribute, Interface
-from zope.interface.advice import addClassAdvisor
+import gc
+import os
+import sys
+# the low level thread module is built in, threading (and the modules it 
+# imports) is only imported once a manager or an activation needs it.
+import thread
+import weakref
+
+# the interface backend is chosen once, when giblets is first imported.
+INTERFACE_BACKEND = os.environ.get('GIBLETS_INTERFACE_BACKEND') or 'zope'
+if INTERFACE_BACKEND == 'zope':
+    from giblets import zope_backend as _backend
+elif INTERFACE_BACKEND == 'native':
+    from giblets import native_backend as _backend
+else:
+    raise ImportError('unknown giblets interface backend %r' % INTERFACE_BACKEND)
+Attribute = _backend.Attribute
+Interface = _backend.Interface
+implements = _backend.implements
+implements_only = _backend.implements_only
 
 __all__ = ['Attribute', 'Component', 'ComponentManager', 'ExtensionPoint', 'ExtensionInterface', 
            'implements', 'implements_only', 'implemented_by', 'is_implemented_by', 
-           'ExtensionError']
+           'ExtensionError', 'ComponentRegistry', 'get_registry', 'unregister',
+           'extension_order', 'Preload', 'deferred_registration', 
+           'define_components']
 
 class ExtensionError(Exception):
     """Exception for extension related errors."""
@@ -35,35 +54,250 @@ class ExtensionInterface(Interface):
 class ExtensionPoint(property):
     """Marker class for extension points in components."""
 
-    def __init__(self, interface):
+    def __init__(self, interface, direct=False, exclude=()):
         """Create the extension point.
         
         @param interface: the `ExtensionInterface` subclass that defines the protocol
             for the extension point
+        @param direct: if True, only include components declaring the interface
+            itself rather than an interface derived from it
+        @param exclude: derived interface(s) whose implementors should be left out
+            unless they also implement the interface some other way
         """
         property.__init__(self, self.extensions)
         self.interface = interface
+        self.direct = direct
+        self.exclude = exclude
         self.__doc__ = 'List of components that implement `%s`' % \
                        self.interface.__name__
 
     def extensions(self, component):
         """Return a list of components that declare they implement the extension
-        point interface.
+        point interface.  Pooled components in the list are leased from 
+        their pools, using the list in a with block returns them on leaving it.
         """
-        return component.compmgr.get_all(self.interface)
+        compmgr = component.compmgr
+        return _Extensions(compmgr, _with_leasing(compmgr.get_all, self.interface, 
+                                                  self.direct, self.exclude))
 
     def __repr__(self):
         """Return a textual representation of the extension point."""
         return '<ExtensionPoint %s>' % self.interface.__name__
 
 
+DEFAULT_REGISTRY = 'default'
+
+class ComponentRegistry(object):
+    """
+    A named collection of Component types along with an index 
+    of the ExtensionInterfaces they implement.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # concrete Component types in order of definition
+        self.components = []
+        # ExtensionInterface -> list of implementing Component types
+        self.interfaces = {}
+        # ExtensionInterface -> {Component type: declared interfaces 
+        # through which the type implements the interface}
+        self.routes = {}
+        # incremented whenever the contents of the registry change
+        self.generation = 0
+        # query key -> (generation, implementors)
+        self._queries = {}
+
+    def __repr__(self):
+        return '<ComponentRegistry %s>' % self.name
+
+    def add(self, cls):
+        """
+        add the Component type given to the registry.  Its interfaces
+        are indexed separately by index_interfaces.
+        """
+        self.components.append(cls)
+        self._changed()
+
+    def add_all(self, classes):
+        """
+        add the Component types given to the registry and index their
+        interfaces as a single update.
+        """
+        self.components.extend(classes)
+        for cls in classes:
+            self._index(cls)
+        self._changed()
+
+    def index_interfaces(self, cls):
+        """
+        record cls as an implementor of each ExtensionInterface it 
+        implements.
+        """
+        self._index(cls)
+        self._changed()
+
+    def _index(self, cls):
+        for declared in _backend.declared_interfaces(cls):
+            for interface in declared.__iro__:
+                if interface.extends(ExtensionInterface):
+                    # the route goes in first, so that a lookup finding 
+                    # cls among the implementors always has its route.
+                    routes = self.routes.setdefault(interface, {})
+                    routes.setdefault(cls, set()).add(declared)
+                    implementors = self.interfaces.setdefault(interface, [])
+                    if not cls in implementors:
+                        implementors.append(cls)
+
+    def remove(self, cls, replacement=None):
+        """
+        remove cls from the registry, putting replacement (which must 
+        already be registered) in the place it held.  returns False if 
+        cls was not registered.
+        """
+        if not cls in self.components:
+            return False
+
+        def swap(seq):
+            if replacement is not None and replacement in seq:
+                seq.remove(replacement)
+                seq[seq.index(cls)] = replacement
+            else:
+                seq.remove(cls)
+
+        swap(self.components)
+        for interface in _backend.class_iro(cls):
+            implementors = self.interfaces.get(interface)
+            if implementors is not None and cls in implementors:
+                swap(implementors)
+                del self.routes[interface][cls]
+                if not implementors:
+                    del self.interfaces[interface]
+                    del self.routes[interface]
+        self._changed()
+        return True
+
+    def implementors(self, iface, direct=False, exclude=()):
+        """
+        the Component types implementing the interface given, in 
+        registration order unless rearranged by extension_order 
+        declarations.
+        
+        If direct is True, only types that declare the interface 
+        itself are included, not those that only implement it by 
+        declaring a derived interface.
+        
+        exclude may be an interface (or a sequence of interfaces)
+        derived from iface, types that only implement iface by way of 
+        the excluded interfaces are left out. 
+        """
+        if not direct and not exclude:
+            key = iface
+        else:
+            if not isinstance(exclude, (tuple, list)):
+                exclude = (exclude,)
+            key = (iface, direct, tuple(exclude))
+        # results are kept with the generation they were computed 
+        # from, so that a lookup racing with a change to the registry 
+        # can't leave a stale result behind.
+        generation = self.generation
+        cached = self._queries.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+
+        implementors = self.interfaces.get(iface, ())
+        if key is not iface:
+            routes = self.routes.get(iface, {})
+            def wanted(declared):
+                if direct and declared is not iface:
+                    return False
+                for excluded in exclude:
+                    if declared.isOrExtends(excluded):
+                        return False
+                return True
+            # a type being removed may already have lost its route.
+            implementors = [cls for cls in implementors 
+                            if any(wanted(d) for d in routes.get(cls, ()))]
+        result = _resolve_order(iface, implementors)
+        self._queries[key] = (generation, result)
+        return result
+
+    def _changed(self):
+        self.generation += 1
+        self._queries.clear()
+
+def _resolve_order(iface, implementors):
+    """
+    sort implementors of iface according to their extension_order 
+    declarations for it.  Types with higher priority come first, 
+    before and after constraints are honored, and registration order 
+    breaks ties.  returns a tuple.
+    """
+    orders = {}
+    for cls in implementors:
+        order = getattr(cls, '__extension_order__', {}).get(iface)
+        if order is not None:
+            orders[cls] = order
+    if not orders:
+        return tuple(implementors)
+
+    by_id = dict((_component_id(cls), cls) for cls in implementors)
+    position = dict((cls, i) for i, cls in enumerate(implementors))
+    followers = dict((cls, set()) for cls in implementors)
+    for cls, (priority, before, after) in orders.items():
+        for other in before:
+            other = by_id.get(_component_id(other))
+            if other is not None and other is not cls:
+                followers[cls].add(other)
+        for other in after:
+            other = by_id.get(_component_id(other))
+            if other is not None and other is not cls:
+                followers[other].add(cls)
+    waiting = dict((cls, 0) for cls in implementors)
+    for cls in implementors:
+        for other in followers[cls]:
+            waiting[other] += 1
+
+    def sort_key(cls):
+        return (-orders.get(cls, (0,))[0], position[cls])
+    ready = sorted([cls for cls in implementors if not waiting[cls]], 
+                   key=sort_key)
+    result = []
+    while ready:
+        cls = ready.pop(0)
+        result.append(cls)
+        for other in followers[cls]:
+            waiting[other] -= 1
+            if not waiting[other]:
+                ready.append(other)
+        ready.sort(key=sort_key)
+
+    if len(result) != len(implementors):
+        cycle = sorted(_component_id(cls) for cls in implementors 
+                       if waiting[cls])
+        raise ExtensionError('Cyclic extension_order for %s among %s' % 
+                             (iface.__name__, ', '.join(cycle)))
+    return tuple(result)
+
+def get_registry(name=DEFAULT_REGISTRY):
+    """
+    return the ComponentRegistry with the name given, creating it 
+    if it does not exist yet.
+    """
+    registry = ComponentMeta._registries.get(name)
+    if registry is None:
+        registry = ComponentMeta._registries.setdefault(name, 
+                                                        ComponentRegistry(name))
+    return registry
+
+def _registry_of(cls):
+    return get_registry(cls.__dict__.get('_registry_name', DEFAULT_REGISTRY))
+
 class ComponentMeta(type):
     """Meta class for components.
     
     Takes care of component and extension point registration.
     """
-    _components = []
-    _registry = {}
+    _registries = {}
 
     def __new__(cls, name, bases, d):
         """Create the component class."""
@@ -72,109 +306,270 @@ class ComponentMeta(type):
         if name == 'Component':
             # Don't put the Component base class in the registry
             return new_class
+        _backend.install(_register_interfaces)
 
         # Only override __init__ for Components not inheriting ComponentManager
-        if not any(issubclass(x, ComponentManager) for x in bases):
+        if not issubclass(new_class, ComponentManager):
             # Allow components to have a no-argument initializer so that
             # they don't need to worry about accepting the component manager
-            # as argument and invoking the super-class initializer
+            # as argument and invoking the super-class initializer.
+            # The initializer to run is kept in _giblets_init, so 
+            # subclasses simply inherit it.
             init = d.get('__init__')
-            if not init:
-                # Because we're replacing the initializer, we need to make sure
-                # that any inherited initializers are also called.
-                for init in [b.__init__._original for b in new_class.mro()
-                             if issubclass(b, Component)
-                             and '__init__' in b.__dict__]:
-                    break
-            def maybe_init(self, compmgr, init=init, cls=new_class):
-                component_id = _component_id(cls)
-                if component_id not in compmgr.components:
-                    compmgr.components[component_id] = self
-                    if init:
-                        try:
-                            init(self)
-                        except:
-                            del compmgr.components[component_id]
-                            raise
-            maybe_init._original = init
-            new_class.__init__ = maybe_init
+            if init:
+                new_class._giblets_init = staticmethod(init)
+            new_class.__init__ = _maybe_init
+
+        if getattr(new_class, 'shared', False):
+            extension_points = [attr for attr in dir(new_class) 
+                                if isinstance(getattr(new_class, attr, None), 
+                                              ExtensionPoint)]
+            if extension_points:
+                raise TypeError('shared Component %s cannot have ExtensionPoints (%s)' % 
+                                (name, ', '.join(extension_points)))
 
         if d.get('abstract'):
             # Don't put abstract component classes in the registry
             return new_class
 
-        ComponentMeta._components.append(new_class)
+        # the registry is chosen by the (possibly inherited) '__registry__' 
+        # attribute and fixed at definition time.
+        registry_name = getattr(new_class, '__registry__', None) or DEFAULT_REGISTRY
+        if not isinstance(registry_name, basestring):
+            raise TypeError('__registry__ of Component %s must be a registry name, not %r' % 
+                            (name, registry_name))
+        new_class._registry_name = registry_name
+        deferred = getattr(_deferred, 'classes', None)
+        if deferred is not None:
+            # registered along with the rest of the batch on leaving
+            # deferred_registration.
+            deferred.append(new_class)
+            return new_class
+        _registry_of(new_class).add(new_class)
+        journal = getattr(_deferred, 'journal', None)
+        if journal is not None:
+            journal.append(new_class)
         
         # if there are interfaces implemented by this class, 
-        # a class adivsor calling _register_interfaces
-        # will be called when zope.interface has finished 
+        # the zope backend calls _register_interfaces from a 
+        # class advisor when zope.interface has finished 
         # working on it. Otherwise, we just register now
         # to pick up any inherited interfaces. 
-        if new_class.__dict__.get('__implements_advice_data__'):
+        if _backend.class_defined(new_class):
             return new_class
         else:
             return _register_interfaces(new_class)
             
+def _maybe_init(self, compmgr):
+    # only the thread that created the instance initializes it, 
+    # and only once.
+    activation = self.__dict__.get('_giblets_activation')
+    if activation is None or activation.started or \
+            activation.thread != thread.get_ident():
+        return
+    activation.started = True
+    try:
+        init = self._giblets_init
+        if init:
+            init(self)
+    except:
+        activation.failed = True
+        compmgr._discard(_component_id(self), self)
+        raise
+    finally:
+        del self._giblets_activation
+        activation.done.set()
+
 def _register_interfaces(cls):
     # skip classes that were not determined to be 
     # concrete Components by the component metaclass.
-    
-    if not cls in ComponentMeta._components:
+    if not '_registry_name' in cls.__dict__:
         return cls
-        
-    registry = ComponentMeta._registry
-    for interface in zi.implementedBy(cls).__iro__:
-        if interface.extends(ExtensionInterface):
-            registry.setdefault(interface, [])
-            if not cls in registry[interface]:
-                registry[interface].append(cls)
-                
+    registry = _registry_of(cls)
+    if not cls in registry.components:
+        return cls
+
+    registry.index_interfaces(cls)
     return cls
 
-##############################################################################
-# XXX monkey patch for mixing with zope.interface
-# this monkey patch allows us to attach an additional class advisor that
-# is executed after the class advisor generated by any of the implements()
-# type declarations. The class advisor allows us to register the interfaces
-# that are set up by the zope.interface class advisor.
-import sys
-from zope.interface import declarations
-from zope.interface.declarations import _implements_advice
-def _patched_implements(name, interfaces, classImplements):
-    frame = sys._getframe(2)
-    locals = frame.f_locals
+_deferred = thread._local()
+
+class deferred_registration(object):
+    """
+    context manager that holds back the registration of Components 
+    defined in the current thread until it exits, then adds them to 
+    their registries in one update per registry.  May be nested, the 
+    outermost block does the registering.  
+    
+    If the block raises, the Components defined in it are not registered.
+    """
 
-    # Try to make sure we were called from a class def. In 2.2.0 we can't
-    # check for __module__ since it doesn't seem to be added to the locals
-    # until later on.
-    if (locals is frame.f_globals) or (
-        ('__module__' not in locals) and sys.version_info[:3] > (2, 2, 0)):
-        raise TypeError(name+" can be used only from a class definition.")
+    def __init__(self):
+        self.classes = []
 
-    if '__implements_advice_data__' in locals:
-        raise TypeError(name+" can be used only once in a class definition.")
+    def __enter__(self):
+        self.outermost = getattr(_deferred, 'classes', None) is None
+        if self.outermost:
+            _deferred.classes = self.classes
+        else:
+            self.classes = _deferred.classes
+        self.start = len(self.classes)
+        return self
 
-    locals['__implements_advice_data__'] = interfaces, classImplements
-    addClassAdvisor(_implements_advice, depth=3)
-    addClassAdvisor(_register_interfaces, depth=3)
-declarations._implements = _patched_implements
-###############################################################################
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            del self.classes[self.start:]
+        if self.outermost:
+            del _deferred.classes
+            _register_batch(self.classes)
+        return False
 
-def implements(*interfaces):
+class _rollback_on_failure(object):
+    """
+    context manager that unregisters the Components registered in
+    the current thread within the block if the block raises.
     """
-    Declare a list of ExtensionInterfaces implemented by a 
-    Component.
+
+    def __enter__(self):
+        self.outer = getattr(_deferred, 'journal', None)
+        self.registered = _deferred.journal = []
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _deferred.journal = self.outer
+        if exc_type is not None:
+            for cls in reversed(self.registered):
+                unregister(cls)
+        elif self.outer is not None:
+            self.outer.extend(self.registered)
+        return False
+
+def _register_batch(classes):
+    batches = {}
+    for cls in classes:
+        batches.setdefault(cls._registry_name, []).append(cls)
+    for name in sorted(batches):
+        get_registry(name).add_all(batches[name])
+    journal = getattr(_deferred, 'journal', None)
+    if journal is not None:
+        journal.extend(classes)
+
+def define_components(specs, module=None):
     """
-    _patched_implements("implements", interfaces, zi.classImplements)
+    create and register a Component type for each spec given, a 
+    tuple of (name, bases, attributes) with an optional fourth item 
+    listing the ExtensionInterfaces the type implements.  The types are 
+    registered as a single batch, or not at all if any of them can't be 
+    created.  module is used as the __module__ 
+    of the types (by default, the caller's module).
     
+    returns the list of new Component types.
+    """
+    if module is None:
+        module = sys._getframe(1).f_globals.get('__name__')
+    classes = []
+    with deferred_registration():
+        for spec in specs:
+            name, bases, attributes = spec[:3]
+            attributes = dict(attributes)
+            attributes.setdefault('__module__', module)
+            cls = ComponentMeta(name, tuple(bases), attributes)
+            if len(spec) > 3 and spec[3]:
+                _backend.class_implements(cls, spec[3])
+            classes.append(cls)
+    return classes
+
+def _is_registered(cls):
+    return '_registry_name' in cls.__dict__ and \
+           cls in _registry_of(cls).components
 
-def implements_only(*interfaces):
+def unregister(module_or_class):
     """
-    declare that a Component implements exactly the list 
-    of ExtensionInterfaces specified, overriding any 
-    inherited declarations of implemented ExtensionInterfaces.
+    remove Components from the registry so that they (and the 
+    modules defining them) may be reclaimed. 
+    
+    module_or_class may be a Component type, a module or the 
+    name of a module, in which case every Component defined in 
+    that module is removed.  Instances of the removed Components 
+    are deactivated in every ComponentManager.
+    
+    returns the list of Component types that were removed.
     """
-    _patched_implements("implementsOnly", interfaces, zi.classImplementsOnly)
+    if isinstance(module_or_class, type):
+        doomed = [module_or_class]
+    else:
+        doomed = _module_components(module_or_class)
+
+    removed = [cls for cls in doomed 
+               if _is_registered(cls) and _registry_of(cls).remove(cls)]
+    _deactivate_everywhere(removed)
+    return removed
+
+def _module_components(module):
+    """
+    the registered Components defined in the module (or module name) given.
+    """
+    if isinstance(module, basestring):
+        module_name = module
+    else:
+        module_name = module.__name__
+    return [cls for registry in ComponentMeta._registries.values()
+            for cls in registry.components
+            if cls.__module__ == module_name]
+
+def _replace_components(old_classes):
+    """
+    swap newly registered Components in for the old classes with the 
+    same component id, keeping their position in the registry.  Old 
+    classes with no replacement are simply removed.  Instances of the 
+    old classes are deactivated in every ComponentManager.
+    """
+    old_classes = [cls for cls in old_classes if _is_registered(cls)]
+    for cls in old_classes:
+        registry = _registry_of(cls)
+        component_id = _component_id(cls)
+        replacement = None
+        for candidate in registry.components:
+            if candidate not in old_classes and \
+                    _component_id(candidate) == component_id:
+                replacement = candidate
+        registry.remove(cls, replacement)
+    _deactivate_everywhere(old_classes)
+
+def _deactivate_everywhere(classes):
+    for mgr in list(_managers):
+        for cls in classes:
+            mgr.deactivate(cls)
+    for cls in classes:
+        _discard_shared(cls)
+
+def _discard_shared(cls, component=None):
+    """
+    forget the shared instance of cls (if it is the component given).
+    """
+    _shared_lock.acquire()
+    try:
+        if cls in _shared_instances and \
+                (component is None or _shared_instances[cls] is component):
+            del _shared_instances[cls]
+    finally:
+        _shared_lock.release()
+
+def extension_order(interface, priority=0, before=(), after=()):
+    """
+    declare where a Component should appear among the implementors 
+    of the ExtensionInterface given.  Implementors with a higher 
+    priority come first.  before and after list Components (types or 
+    full class name strings) that this Component must come before 
+    or after regardless of priority.  May be used once per interface
+    in a class definition.
+    """
+    frame = sys._getframe(1)
+    locals = frame.f_locals
+    if (locals is frame.f_globals) or ('__module__' not in locals):
+        raise TypeError("extension_order can be used only from a class definition.")
+    orders = locals.setdefault('__extension_order__', {})
+    orders[interface] = (priority, tuple(before), tuple(after))
 
 def implemented_by(thang):
     """
@@ -182,12 +577,12 @@ def implemented_by(thang):
     or Component type.
     """
     if isinstance(thang, type):
-        get_ifaces = zi.implementedBy
+        iro = _backend.class_iro(thang)
     else: 
-        get_ifaces = zi.providedBy
+        iro = _backend.object_iro(thang)
 
     ifaces = []
-    for cls in get_ifaces(thang).__iro__:
+    for cls in iro:
         if hasattr(cls, 'extends') and cls.extends(ExtensionInterface):
             ifaces.append(cls)
     return ifaces
@@ -212,8 +607,24 @@ class Component(object):
 
     Every component can declare what extension points it provides, as well as
     what extension points of other components it extends.
+    
+    A component class may set 'scope' to 'pooled' (the default is 
+    'singleton') to have a new instance for each use.  Pooled components
+    are handed out by ComponentManager.lease and by ExtensionPoints, 
+    which return the instances to the pool for reuse; at most 'pool_size' 
+    idle instances are kept per manager.  get_all leaves them out.  With 
+    scope 'process', the component 
+    runs in 'processes' worker processes and the manager hands out a 
+    proxy for it (see giblets.processes).
+
+    A component class with a true 'shared' attribute has a single instance 
+    for the whole process, used by every ComponentManager that has it 
+    enabled.  Such components must not keep state specific to a manager:
+    their compmgr is None and they may not have ExtensionPoints, which 
+    would otherwise follow the policy of a single manager.
     """
     __metaclass__ = ComponentMeta
+    _giblets_init = None
 
     def __new__(cls, *args, **kwargs):
         """Return an existing instance of the component if it has already been
@@ -228,35 +639,453 @@ class Component(object):
         # The normal case where the component is not also the component manager
         compmgr = args[0]
         component_id = _component_id(cls)
-        self = compmgr.components.get(component_id)
+        usage = compmgr._usage
+        scope = getattr(cls, 'scope', SINGLETON)
+        if scope == PROCESS:
+            proxy = compmgr._process_proxy(cls)
+            if proxy is not None:
+                if usage is not None:
+                    usage.accessed(component_id)
+                return proxy
+        elif scope == POOLED:
+            # pooled components are handed out for a single use, never 
+            # kept in compmgr.components, and only by a lease or an 
+            # ExtensionPoint, which return them to the pool afterwards.
+            if not getattr(_leasing, 'active', False):
+                raise ExtensionError('pooled Component %s can only be used through '
+                                     'ComponentManager.lease or an ExtensionPoint' % 
+                                     component_id)
+            self = compmgr._pool_of(cls).acquire()
+            if usage is not None:
+                if '_giblets_activation' in self.__dict__:
+                    usage.activated(component_id)
+                usage.accessed(component_id)
+            return self
+
+        while True:
+            added = False
+            compmgr._lock.acquire()
+            try:
+                self = compmgr.components.get(component_id)
+                if self is None:
+                    if getattr(cls, 'shared', False):
+                        self = _shared_instance(cls)
+                    else:
+                        self = _new_instance(cls, compmgr)
+                    compmgr.components[component_id] = self
+                    added = True
+            finally:
+                compmgr._lock.release()
+
+            if added:
+                if usage is not None:
+                    usage.activated(component_id)
+                compmgr.component_activated(self)
+
+            # if another thread is still initializing the component, 
+            # wait for it to finish rather than using it half-built.
+            activation = self.__dict__.get('_giblets_activation')
+            if activation is None or \
+                    activation.thread == thread.get_ident():
+                break
+            if not _wait_for(activation):
+                # the other thread is waiting on this one, so hand back 
+                # the instance in progress as a single thread would.
+                break
+            if not activation.failed:
+                break
+            # its initialization failed, try again.
+            compmgr._discard(component_id, self)
+
+        if usage is not None:
+            usage.accessed(component_id)
+        return self
+
+def _new_instance(cls, compmgr):
+    self = object.__new__(cls)
+    self.compmgr = compmgr
+    self._giblets_activation = _Activation()
+    return self
+
+# the instance attribute in which giblets.memo keeps the results 
+# remembered for a Component.
+_MEMO_ATTR = '_giblets_memo'
+
+SINGLETON = 'singleton'
+POOLED = 'pooled'
+PROCESS = 'process'
+DEFAULT_POOL_SIZE = 8
+
+class _Pool(object):
+    """
+    Idle instances of a pooled Component kept by a ComponentManager.
+    At most size idle instances are kept.
+    """
+
+    def __init__(self, cls, compmgr, size):
+        self.cls = cls
+        self.compmgr = compmgr
+        self.size = size
+        self.idle = []
+        self.lock = thread.allocate_lock()
+
+    def acquire(self):
+        self.lock.acquire()
+        try:
+            if self.idle:
+                return self.idle.pop()
+        finally:
+            self.lock.release()
+        return _new_instance(self.cls, self.compmgr)
+
+    def release(self, component):
+        # the next user of the instance starts without remembered results.
+        component.__dict__.pop(_MEMO_ATTR, None)
+        reset = getattr(component, 'reset', None)
+        if reset is not None:
+            try:
+                reset()
+            except Exception:
+                # don't reuse an instance that could not be reset.
+                return
+        self.lock.acquire()
+        try:
+            if len(self.idle) < self.size:
+                self.idle.append(component)
+        finally:
+            self.lock.release()
+
+# set while a lease is handing out instances in the current thread.
+_leasing = thread._local()
+
+class _Lease(object):
+    """
+    The context manager returned by ComponentManager.lease
+    """
+
+    def __init__(self, compmgr, thing):
+        self.compmgr = compmgr
+        self.thing = thing
+        self.instances = []
+
+    def __enter__(self):
+        if isinstance(self.thing, ComponentMeta):
+            leased = _with_leasing(self.compmgr._get_instance_of, self.thing)
+            self.instances = [leased]
+        else:
+            leased = self.instances = _with_leasing(self.compmgr.get_all, self.thing)
+        return leased
+
+    def __exit__(self, *exc_info):
+        _release_pooled(self.compmgr, self.instances)
+        self.instances = []
+
+class _Extensions(list):
+    """
+    The list of implementors returned by an ExtensionPoint.  Used in a 
+    with block, the pooled instances in it are returned to their pools 
+    (and removed from the list) on leaving the block.
+    """
+
+    def __init__(self, compmgr, components):
+        list.__init__(self, components)
+        self.compmgr = compmgr
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        _release_pooled(self.compmgr, self)
+        del self[:]
+        return False
+
+def _with_leasing(func, *args):
+    """
+    call func with pooled Components handed out from their pools.
+    """
+    outer = getattr(_leasing, 'active', False)
+    _leasing.active = True
+    try:
+        return func(*args)
+    finally:
+        _leasing.active = outer
+
+def _release_pooled(compmgr, components):
+    for component in components:
+        if component is not None and \
+                getattr(component, 'scope', SINGLETON) == POOLED:
+            compmgr._pool_of(component.__class__).release(component)
+
+def _is_pooled(cls):
+    return getattr(cls, 'scope', SINGLETON) == POOLED
+
+# Component type -> the instance of each shared Component, used by
+# every ComponentManager.
+_shared_instances = {}
+_shared_lock = thread.allocate_lock()
+
+def _shared_instance(cls):
+    _shared_lock.acquire()
+    try:
+        self = _shared_instances.get(cls)
         if self is None:
-            self = super(Component, cls).__new__(cls)
-            self.compmgr = compmgr
-            compmgr.component_activated(self)
+            # no manager of its own, so it can't outlive (or keep alive) 
+            # the one that happened to ask for it first.
+            self = _shared_instances[cls] = _new_instance(cls, None)
         return self
+    finally:
+        _shared_lock.release()
+
+class _Activation(object):
+    """
+    Marks a Component instance whose initializer has not finished.
+    """
+    def __init__(self):
+        import threading
+        self.thread = thread.get_ident()
+        self.started = False
+        self.failed = False
+        self.done = threading.Event()
 
+# thread id -> the _Activation it is waiting on, so that threads waiting 
+# on each other's Components can be detected.
+_waiting = {}
+_waiting_lock = thread.allocate_lock()
+
+def _wait_for(activation):
+    """
+    wait for another thread to finish initializing a Component.  returns 
+    False without waiting if that thread is waiting, directly or by way 
+    of other threads, on the current thread.
+    """
+    me = thread.get_ident()
+    _waiting_lock.acquire()
+    try:
+        owner = activation.thread
+        seen = set()
+        while owner is not None and owner not in seen:
+            if owner == me:
+                return False
+            seen.add(owner)
+            waited = _waiting.get(owner)
+            owner = waited is not None and waited.thread or None
+        _waiting[me] = activation
+    finally:
+        _waiting_lock.release()
+    try:
+        activation.done.wait()
+    finally:
+        _waiting_lock.acquire()
+        try:
+            del _waiting[me]
+        finally:
+            _waiting_lock.release()
+    return True
+
+class Preload(object):
+    """
+    Activates a list of Components in a ComponentManager on a 
+    background thread.  See ComponentManager.preload.
+    """
+
+    def __init__(self, compmgr, classes):
+        import threading
+        self.compmgr = compmgr
+        self.classes = list(classes)
+        self.completed = 0
+        # (Component type, exception) for each Component that failed
+        self.failed = []
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='giblets-preload')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def progress(self):
+        """
+        returns (number of Components processed, total number of Components)
+        """
+        return (self.completed, len(self.classes))
+
+    def wait(self, timeout=None):
+        """
+        wait for preloading to finish, returns True if it has.
+        """
+        self.done.wait(timeout)
+        return self.done.is_set()
+
+    def _run(self):
+        try:
+            for cls in self.classes:
+                try:
+                    self.compmgr._get_instance_of(cls)
+                except Exception, e:
+                    self.failed.append((cls, e))
+                self.completed += 1
+        finally:
+            self.done.set()
+
+
+# all live ComponentManagers, so that unregistered Components 
+# can be deactivated everywhere.
+_managers = weakref.WeakSet()
 
 class ComponentManager(object):
     """The component manager keeps a pool of active components."""
 
-    def __init__(self):
-        """Initialize the component manager."""
+    def __init__(self, registries=None):
+        """Initialize the component manager.
+        
+        @param registries: names of the ComponentRegistries whose Components
+            are available to this manager, by default only the default registry.
+        """
+        if registries is None:
+            registries = [DEFAULT_REGISTRY]
+        elif isinstance(registries, basestring):
+            registries = [registries]
+        self.registries = tuple(registries)
         self.components = {}
         if isinstance(self, Component):
             my_id = _component_id(self)
             self.components[my_id] = self
         self._restriction = None
+        self._fork_hook_installed = False
+        # (iface, direct, exclude) -> (registry generations, implementors)
+        # for managers using more than one registry.
+        self._implementors_cache = {}
+        self._plan = None
+        self._plan_generations = None
+        self._usage = None
+        import threading
+        self._lock = threading.RLock()
+        # component id -> _Pool for pooled Components
+        self._pools = {}
+        # component id -> ComponentProxy for process scoped Components
+        self._proxies = {}
+        _managers.add(self)
 
     def __contains__(self, cls):
         """Return wether the given class is in the list of active components."""
         return _component_id(cls) in self.components
 
-    def get_all(self, iface):
+    def get_all(self, iface, direct=False, exclude=()):
         """
         retrieves implementors of the interface specified.
+        
+        see ComponentRegistry.implementors for the meaning of 
+        direct and exclude.  Pooled Components are left out, except 
+        within lease, since nothing would return them to their pools.
         """
+        leasing = getattr(_leasing, 'active', False)
+        if self._plan is not None and not direct and not exclude:
+            planned = self._planned_implementors(iface)
+            if planned is not None:
+                return [self._activate(cls) for cls in planned
+                        if leasing or not _is_pooled(cls)]
         return filter(None, [self._get_instance_of(cls) for cls in
-                      ComponentMeta._registry.get(iface, [])])
+                             self._implementors(iface, direct, exclude)
+                             if leasing or not _is_pooled(cls)])
+
+    def call_batch(self, iface, method, items):
+        """
+        call method of every implementor of the interface specified 
+        with each of the items given, collecting the results column 
+        by column.  returns a list of (component, results) pairs in 
+        the order of get_all, each list of results in the order of items.
+        
+        A Component can handle the whole batch in one call by 
+        providing a method named method + '_batch' that takes the list 
+        of items and returns a list of results.  Otherwise, method is 
+        called once per item.  A process scoped Component's batch 
+        method is called once in each worker, with its share of the items.
+        """
+        items = list(items)
+        columns = []
+        batch_name = method + '_batch'
+        for component in self.get_all(iface):
+            # process scoped Components spread the batch over their workers
+            proxied = not isinstance(component, Component) and \
+                      hasattr(component.__class__, 'batch')
+            if proxied:
+                cls = component.component_class
+            else:
+                cls = component.__class__
+            if hasattr(cls, batch_name):
+                if proxied:
+                    results = component.batch(batch_name, items, batched=True)
+                else:
+                    results = list(getattr(component, batch_name)(items))
+                if len(results) != len(items):
+                    raise ExtensionError('%s.%s returned %d results for %d items' % 
+                                         (_component_id(cls), batch_name, 
+                                          len(results), len(items)))
+            elif proxied:
+                results = component.batch(method, items)
+            else:
+                call = getattr(component, method)
+                results = [call(item) for item in items]
+            columns.append((component, results))
+        return columns
+
+    def follow_plan(self, plan):
+        """
+        use a precomputed activation plan, a mapping of ExtensionInterface 
+        to the sequence of enabled implementing Component types in order, 
+        instead of looking up and filtering implementors.  The plan is 
+        dropped if any of this manager's registries change or restrict 
+        is called. Passing None stops following the current plan.
+        
+        see giblets.plan for saving and loading plans.
+        """
+        if plan is None:
+            self._plan = None
+            return
+        self._plan = dict((iface, tuple(classes)) 
+                          for iface, classes in plan.items())
+        self._plan_generations = self._generations()
+
+    def record_usage(self, usage):
+        """
+        report Component activations and accesses to the usage 
+        recorder given (see giblets.warmup.UsageProfile), or stop 
+        recording if usage is None.
+        """
+        self._usage = usage
+
+    def _planned_implementors(self, iface):
+        if self._plan_generations != self._generations():
+            self._plan = None
+            return None
+        return self._plan.get(iface)
+
+    def _generations(self):
+        return tuple(get_registry(name).generation for name in self.registries)
+
+    def _implementors(self, iface, direct=False, exclude=()):
+        """
+        the Component types implementing the interface given in 
+        the registries used by this manager.
+        """
+        if len(self.registries) == 1:
+            return get_registry(self.registries[0]).implementors(iface, 
+                                                                 direct, 
+                                                                 exclude)
+        if isinstance(exclude, list):
+            exclude = tuple(exclude)
+        key = (iface, direct, exclude)
+        registries = [get_registry(name) for name in self.registries]
+        generations = self._generations()
+        cached = self._implementors_cache.get(key)
+        if cached is not None and cached[0] == generations:
+            return cached[1]
+        implementors = []
+        for registry in registries:
+            implementors.extend(registry.implementors(iface, direct, exclude))
+        implementors = _resolve_order(iface, implementors)
+        self._implementors_cache[key] = (generations, implementors)
+        return implementors
 
     def _get_instance_of(self, cls):
         """Activate the component instance for the given class, or return the
@@ -264,11 +1093,20 @@ class ComponentManager(object):
         """
         if not self.is_component_enabled(cls):
             return None
+        return self._activate(cls)
 
+    def _activate(self, cls):
         component_id = _component_id(cls)
         component = self.components.get(component_id)
-        if component is None:
-            if cls not in ComponentMeta._components:
+        if component is not None and \
+                '_giblets_activation' not in component.__dict__:
+            if self._usage is not None:
+                self._usage.accessed(component_id)
+        elif component is not None:
+            # still being initialized, possibly by another thread.
+            component = cls(self)
+        else:
+            if not _is_registered(cls):
                 raise ExtensionError('Component "%s" not registered' % cls.__name__)
             try:
                 component = cls(self)
@@ -277,18 +1115,216 @@ class ComponentManager(object):
                                 (cls, e))
         return component
 
+    def _discard(self, component_id, component):
+        """
+        forget the component instance given if it is the active 
+        instance for component_id.
+        """
+        self._lock.acquire()
+        try:
+            if self.components.get(component_id) is component:
+                del self.components[component_id]
+        finally:
+            self._lock.release()
+        _discard_shared(component.__class__, component)
+
+    def _pool_of(self, cls):
+        component_id = _component_id(cls)
+        pool = self._pools.get(component_id)
+        if pool is None or pool.cls is not cls:
+            self._lock.acquire()
+            try:
+                pool = self._pools.get(component_id)
+                if pool is None or pool.cls is not cls:
+                    size = getattr(cls, 'pool_size', DEFAULT_POOL_SIZE)
+                    pool = self._pools[component_id] = _Pool(cls, self, size)
+            finally:
+                self._lock.release()
+        return pool
+
+    def _process_proxy(self, cls):
+        """
+        the ComponentProxy for a process scoped Component, starting its 
+        worker processes if they are not running.
+        """
+        component_id = _component_id(cls)
+        self._lock.acquire()
+        try:
+            proxy = self._proxies.get(component_id)
+            if proxy is None or proxy.component_class is not cls:
+                from giblets.processes import ComponentProxy
+                proxy = self._proxies[component_id] = ComponentProxy(cls, self)
+            return proxy
+        finally:
+            self._lock.release()
+
+    def shutdown(self):
+        """
+        stop the worker processes of any process scoped Components.
+        """
+        self._lock.acquire()
+        try:
+            proxies = self._proxies.values()
+            self._proxies = {}
+        finally:
+            self._lock.release()
+        for proxy in proxies:
+            proxy.close()
+
+    def lease(self, thing):
+        """
+        use pooled Components for the duration of a with block. thing 
+        may be a Component type, in which case the block is given its 
+        instance (or None if it is disabled), or an ExtensionInterface, 
+        in which case the block is given the list of its implementors 
+        as returned by get_all.  On leaving the block, each pooled 
+        instance has its reset method (if any) called and is returned 
+        to the pool for reuse. Singleton Components are unaffected.
+        
+        ExtensionPoints lease pooled Components in the same way (see 
+        ExtensionPoint.extensions).  get_all leaves them out and asking 
+        for one directly raises ExtensionError.
+        
+        eg:
+        with mgr.lease(IParser) as parsers:
+            for parser in parsers:
+                parser.feed(data)
+        """
+        return _Lease(self, thing)
+
+    def preload(self, things):
+        """
+        start activating Components on a background thread. things 
+        is a list of Component types and ExtensionInterfaces, which 
+        stand for their enabled implementors.  Requests for a 
+        Component that is still being initialized wait for it to 
+        finish rather than initializing it again.
+        
+        returns a started Preload with a done Event, progress() and wait().
+        """
+        classes = []
+        for thing in things:
+            if isinstance(thing, ComponentMeta):
+                candidates = [thing]
+            else:
+                candidates = self._implementors(thing)
+            for cls in candidates:
+                if cls not in classes:
+                    classes.append(cls)
+        return Preload(self, classes).start()
+
     def component_activated(self, component):
         """Can be overridden by sub-classes so that special initialization for
         components can be provided.
         """
+
+    def deactivate(self, component):
+        """
+        discard the active instance of the component specified, if any. 
+        The next request for the component will create a new instance, 
+        except for a shared component: its one instance is still used 
+        by other managers, so the next request gets that instance back.  
+        Unregistering the component is the way to be rid of it.
+        
+        component may be a full class name string 'foo.bar.Quux' 
+        a Component type or an instance of a Component.
+        """
+        component_id = _component_id(component)
+        if component_id == _component_id(self):
+            return
+        self._pools.pop(component_id, None)
+        proxy = self._proxies.pop(component_id, None)
+        if proxy is not None:
+            proxy.close()
+        instance = self.components.pop(component_id, None)
+        if instance is not None:
+            # discard any results remembered by giblets.memo.memoize
+            instance.__dict__.pop(_MEMO_ATTR, None)
+            self.component_deactivated(instance)
+
+    def component_deactivated(self, component):
+        """Can be overridden by sub-classes so that special cleanup for
+        components can be provided.
+        """
+
+    def prepare_for_fork(self, components=(), interfaces=()):
+        """
+        get ready to be shared by worker processes forked after this call.
+        
+        The Components and the implementors of the interfaces listed 
+        are activated, the implementor lookups for every interface in 
+        this manager's registries are built and a full garbage 
+        collection is run, so that workers start with as little as 
+        possible left to build or collect.
+        
+        Where gc.freeze is available (Python 3.7 and later), everything 
+        allocated so far is also moved out of the reach of the garbage 
+        collector so that the workers do not touch, and therefore copy, 
+        the shared pages.  Where os.register_at_fork is available, 
+        after_fork is called in each child process automatically.  On 
+        Python 2 neither exists: each worker should call after_fork 
+        itself, passing gc_threshold to keep the collector from 
+        walking the shared objects.
+        """
+        for cls in components:
+            self._get_instance_of(cls)
+        for iface in interfaces:
+            self.get_all(iface)
+        for name in self.registries:
+            registry = get_registry(name)
+            for iface in registry.interfaces.keys():
+                registry.implementors(iface)
+
+        if hasattr(os, 'register_at_fork') and not self._fork_hook_installed:
+            ref = weakref.ref(self)
+            def after_fork_in_child():
+                mgr = ref()
+                if mgr is not None:
+                    mgr.after_fork()
+            os.register_at_fork(after_in_child=after_fork_in_child)
+            self._fork_hook_installed = True
+
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+    def after_fork(self, gc_threshold=None):
+        """
+        call after_fork on each active Component that has one, so that 
+        Components can reopen files, sockets etc. in a forked worker.
+        
+        If gc_threshold is given (an int or a tuple), it is passed to 
+        gc.set_threshold in the worker.  0 turns off automatic garbage 
+        collection, larger values make it less frequent.  Without 
+        gc.freeze, every full collection touches the objects the worker 
+        shares with its parent, copying their pages.
+        """
+        if gc_threshold is not None:
+            if isinstance(gc_threshold, (int, long)):
+                gc_threshold = (gc_threshold,)
+            gc.set_threshold(*gc_threshold)
+        for component in self.components.values():
+            if component is self:
+                continue
+            hook = getattr(component, 'after_fork', None)
+            if hook is not None:
+                hook()
     
     def restrict(self, policy):
         """
         restrict enabled components according to the policy 
         given -- is_component_enabled will be delegated to the 
-        object specified.
+        object specified.  Any activation plan being followed and any 
+        results remembered by giblets.memo.memoize are dropped, since 
+        they may depend on what the old policy enabled.
         """
         self._restriction = policy
+        self._plan = None
+        for component in self.components.values():
+            component.__dict__.pop(_MEMO_ATTR, None)
+        for pool in self._pools.values():
+            for component in list(pool.idle):
+                component.__dict__.pop(_MEMO_ATTR, None)
 
     def is_component_enabled(self, cls):
         """Controlled by policy given at construction time, but can be overridden 
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Memoization of Component methods.  
+
+The results are kept on the Component instance, so they go away 
+when the Component is deactivated in its ComponentManager (including 
+when it is unregistered or reloaded).  They are also thrown away when 
+the manager is given a new policy with restrict, and when a pooled 
+instance is returned to its pool.
+"""
+from collections import namedtuple, OrderedDict
+import threading
+import time
+
+from giblets.core import _MEMO_ATTR
+
+__all__ = ['memoize']
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+# name of the instance attribute holding a Component's caches, 
+# which the ComponentManager discards when they may be out of date.
+CACHES_ATTR = _MEMO_ATTR
+
+def memoize(maxsize=128, ttl=None):
+    """
+    decorate a Component method whose result depends only on its 
+    arguments so that results are remembered, eg:
+    
+    class Schema(Component):
+        @memoize(maxsize=1000, ttl=60)
+        def lookup(self, name):
+            ...
+
+    At most maxsize results are kept per Component instance, least 
+    recently used first out.  A maxsize of None keeps them all.  If 
+    ttl is given, results are only used for that many seconds.  
+    Arguments must be hashable. 
+
+    The bound method has cache_info() returning (hits, misses, 
+    maxsize, currsize) and cache_clear().
+
+    memoize may also be used without arguments: @memoize
+    """
+    if callable(maxsize):
+        return MemoizedMethod(maxsize)
+    def decorate(func):
+        return MemoizedMethod(func, maxsize, ttl)
+    return decorate
+
+class MemoizedMethod(object):
+
+    def __init__(self, func, maxsize=128, ttl=None):
+        self.func = func
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return _BoundMemo(self, instance)
+
+class _BoundMemo(object):
+
+    def __init__(self, method, instance):
+        self.method = method
+        self.instance = instance
+        self.__name__ = method.__name__
+        self.__doc__ = method.__doc__
+
+    def _cache(self):
+        caches = self.instance.__dict__.get(CACHES_ATTR)
+        if caches is None:
+            caches = self.instance.__dict__.setdefault(CACHES_ATTR, {})
+        cache = caches.get(self.method)
+        if cache is None:
+            cache = caches.setdefault(self.method, 
+                                      _Cache(self.method.maxsize, 
+                                             self.method.ttl))
+        return cache
+
+    def __call__(self, *args, **kwargs):
+        key = args
+        if kwargs:
+            key += (_kwargs_mark,) + tuple(sorted(kwargs.items()))
+        return self._cache().get(key, self.method.func, self.instance, 
+                                 args, kwargs)
+
+    def cache_info(self):
+        return self._cache().info()
+
+    def cache_clear(self):
+        self._cache().clear()
+
+_kwargs_mark = object()
+
+class _Cache(object):
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, func, instance, args, kwargs):
+        now = time.time()
+        self.lock.acquire()
+        try:
+            try:
+                result, expires = self.results.pop(key)
+            except KeyError:
+                pass
+            except TypeError:
+                # unhashable arguments, just call through.
+                self.misses += 1
+                return func(instance, *args, **kwargs)
+            else:
+                if expires is None or expires > now:
+                    self.results[key] = (result, expires)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+        finally:
+            self.lock.release()
+
+        result = func(instance, *args, **kwargs)
+        expires = None
+        if self.ttl is not None:
+            expires = now + self.ttl
+        self.lock.acquire()
+        try:
+            self.results[key] = (result, expires)
+            while self.maxsize is not None and len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+        finally:
+            self.lock.release()
+        return result
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.results))
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.results.clear()
+            self.hits = self.misses = 0
+        finally:
+            self.lock.release()
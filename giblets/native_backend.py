@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Pure python interface backend, selected by setting the environment
+variable GIBLETS_INTERFACE_BACKEND=native before giblets is imported.
+
+Interfaces are ordinary classes and declarations are recorded in the
+class body, so no class advisors are needed and nothing from
+zope.interface is imported.  The interface resolution order of a
+Component is worked out once, when the class is defined.  Only what
+giblets itself uses is supported: Interface, Attribute, implements
+and implements_only on classes.
+"""
+import sys
+
+DECLARATION = '__giblets_implements__'
+DECLARED = '__giblets_declared__'
+IRO = '__giblets_iro__'
+
+class InterfaceClass(type):
+    """Metaclass for native interfaces."""
+
+    def __init__(cls, name, bases, d):
+        type.__init__(cls, name, bases, d)
+        cls.__iro__ = tuple(x for x in cls.__mro__
+                            if isinstance(x, InterfaceClass))
+
+    def extends(cls, other, strict=True):
+        """True if the interface extends other."""
+        return other in cls.__iro__ and (not strict or other is not cls)
+
+    def isOrExtends(cls, other):
+        """True if the interface is other or extends it."""
+        return other in cls.__iro__
+
+    def implementedBy(cls, klass):
+        """True if instances of klass provide the interface."""
+        return cls in class_iro(klass)
+
+    def providedBy(cls, obj):
+        """True if obj provides the interface."""
+        return cls in object_iro(obj)
+
+class Interface(object):
+    __metaclass__ = InterfaceClass
+
+class Attribute(object):
+    """An attribute described by an interface."""
+
+    def __init__(self, __name__, __doc__=''):
+        if not __doc__ and ' ' in __name__:
+            __doc__ = __name__
+            __name__ = None
+        self.__name__ = __name__
+        self.__doc__ = __doc__
+
+def _declare(name, interfaces, only):
+    frame = sys._getframe(2)
+    locals = frame.f_locals
+    if (locals is frame.f_globals) or ('__module__' not in locals):
+        raise TypeError(name + " can be used only from a class definition.")
+    if DECLARATION in locals:
+        raise TypeError(name + " can be used only once in a class definition.")
+    for interface in interfaces:
+        if not isinstance(interface, InterfaceClass):
+            raise TypeError("%r is not an interface" % (interface,))
+    locals[DECLARATION] = tuple(interfaces), only
+
+def implements(*interfaces):
+    """
+    Declare a list of ExtensionInterfaces implemented by a
+    Component.
+    """
+    _declare("implements", interfaces, False)
+
+def implements_only(*interfaces):
+    """
+    declare that a Component implements exactly the list
+    of ExtensionInterfaces specified, overriding any
+    inherited declarations of implemented ExtensionInterfaces.
+    """
+    _declare("implements_only", interfaces, True)
+
+def class_implements(cls, interfaces):
+    """
+    declare interfaces implemented by cls after it has been defined.
+    """
+    declared, only = cls.__dict__.get(DECLARATION, ((), False))
+    for interface in interfaces:
+        if not isinstance(interface, InterfaceClass):
+            raise TypeError("%r is not an interface" % (interface,))
+    setattr(cls, DECLARATION, (declared + tuple(interfaces), only))
+    for name in (DECLARED, IRO):
+        if name in cls.__dict__:
+            delattr(cls, name)
+
+def install(registrar):
+    """nothing to install, registration never waits on the class body."""
+
+def class_defined(cls):
+    """
+    work out the interface resolution order of cls while it is
+    being defined.  The registrar is never called later, so this
+    always returns False.
+    """
+    class_iro(cls)
+    return False
+
+def _cached(cls, name, compute):
+    try:
+        return cls.__dict__[name]
+    except KeyError:
+        value = compute(cls)
+        try:
+            setattr(cls, name, value)
+        except TypeError:
+            # builtin types, which never declare anything
+            pass
+        return value
+
+def _declared(cls):
+    interfaces, only = cls.__dict__.get(DECLARATION, ((), False))
+    declared = list(interfaces)
+    if not only:
+        for base in cls.__bases__:
+            for interface in declared_interfaces(base):
+                if not interface in declared:
+                    declared.append(interface)
+    return tuple(declared)
+
+def declared_interfaces(cls):
+    """
+    the interfaces declared by cls or inherited declarations.
+    """
+    return _cached(cls, DECLARED, _declared)
+
+def _iro(cls):
+    # later occurrences win, so that base interfaces shared by
+    # several declarations come after all of them.
+    everything = [interface for declared in declared_interfaces(cls)
+                  for interface in declared.__iro__]
+    iro = []
+    seen = set()
+    for interface in reversed(everything):
+        if not interface in seen:
+            seen.add(interface)
+            iro.append(interface)
+    iro.reverse()
+    return tuple(iro)
+
+def class_iro(cls):
+    """
+    every interface implemented by instances of cls, most specific first.
+    """
+    return _cached(cls, IRO, _iro)
+
+def object_iro(obj):
+    """
+    every interface provided by obj, most specific first.
+    """
+    return class_iro(obj.__class__)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Activation plans record which Components a ComponentManager has 
+enabled for each ExtensionInterface, in order, along with the modules 
+that define them.  A plan saved by one process can be loaded by the 
+next to skip plugin discovery and policy evaluation entirely, as long 
+as the code it describes has not changed.
+
+Modules that giblets.search loaded from plugin files are loaded again 
+from the same (absolute) paths, others are imported by name.
+"""
+import json
+import os
+import sys
+
+from giblets.core import _component_id
+
+__all__ = ['save_plan', 'load_plan']
+
+import logging
+log = logging.getLogger(__name__)
+
+PLAN_FORMAT = 2
+
+def save_plan(mgr, filename, interfaces, version=None):
+    """
+    write the activation plan of the ComponentManager given for each
+    of the ExtensionInterfaces listed to filename.  
+    
+    version is an optional string (eg the application's release) 
+    that must match when the plan is loaded.
+    """
+    planned = {}
+    modules = set()
+    for iface in interfaces:
+        classes = mgr._implementors(iface)
+        enabled = [cls for cls in classes if mgr.is_component_enabled(cls)]
+        planned[_interface_id(iface)] = [_component_id(cls) for cls in enabled]
+        modules.add(iface.__module__)
+        modules.update(cls.__module__ for cls in enabled)
+
+    plan = {
+        'format': PLAN_FORMAT,
+        'version': version,
+        'modules': sorted(modules),
+        'sources': dict((m, _source_state(m)) for m in modules),
+        'plugin_files': _plugin_files(modules),
+        'interfaces': planned,
+    }
+    f = open(filename, 'w')
+    try:
+        json.dump(plan, f, separators=(',', ':'), sort_keys=True)
+    finally:
+        f.close()
+
+def load_plan(mgr, filename, version=None):
+    """
+    import the modules named in the activation plan in filename and 
+    have the ComponentManager given follow it.  
+    
+    returns False, leaving the manager alone, if the plan cannot be 
+    read or does not match the version given or the source files of 
+    the modules it names. In that case the caller should fall back 
+    to discovering plugins normally.
+    """
+    try:
+        f = open(filename)
+        try:
+            plan = json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError), e:
+        log.debug("Unable to read plan %s: %s" % (filename, e))
+        return False
+
+    if plan.get('format') != PLAN_FORMAT or plan.get('version') != version:
+        log.debug("Plan %s is for a different version" % filename)
+        return False
+    for module_name, state in plan['sources'].items():
+        if state is not None and _file_state(state[0]) != tuple(state[1:]):
+            log.debug("Plan %s is out of date, %s changed" % 
+                      (filename, module_name))
+            return False
+
+    try:
+        for module_name in plan['modules']:
+            if module_name in sys.modules:
+                continue
+            py_file = plan['plugin_files'].get(module_name)
+            if py_file is not None:
+                from giblets.search import _load_source
+                _load_source(module_name, py_file)
+            else:
+                __import__(module_name)
+        follow = {}
+        for iface_id, component_ids in plan['interfaces'].items():
+            iface = _lookup(iface_id)
+            follow[iface] = [_lookup(comp_id) for comp_id in component_ids]
+    except (ImportError, IOError, AttributeError, KeyError), e:
+        log.debug("Unable to follow plan %s: %s" % (filename, e))
+        return False
+
+    mgr.follow_plan(follow)
+    return True
+
+def _interface_id(iface):
+    return "%s.%s" % (iface.__module__, iface.__name__)
+
+def _lookup(name):
+    module_name, attr = name.rsplit('.', 1)
+    return getattr(sys.modules[module_name], attr)
+
+def _source_state(module_name):
+    """
+    [path, mtime, size] of the source file of the module given, 
+    or None if it has none.
+    """
+    filename = _source_file(module_name)
+    if filename is None:
+        return None
+    return [filename] + list(_file_state(filename))
+
+def _source_file(module_name):
+    filename = getattr(sys.modules.get(module_name), '__file__', None)
+    if filename is None:
+        return None
+    if filename.endswith(('.pyc', '.pyo')) and os.path.exists(filename[:-1]):
+        filename = filename[:-1]
+    return os.path.abspath(filename)
+
+def _plugin_files(modules):
+    """
+    module name -> source path of each of the modules given that 
+    giblets.search loaded from a plugin file.
+    """
+    search = sys.modules.get('giblets.search')
+    if search is None:
+        return {}
+    files = {}
+    for module_name in modules:
+        filename = _source_file(module_name)
+        if filename in search._loaded_sources:
+            files[module_name] = filename
+    return files
+
+def _file_state(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
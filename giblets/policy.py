@@ -1,9 +1,8 @@
-import fnmatch
 import re
 
-from giblets.core import _component_id
+from giblets.core import _component_id, ComponentMeta
 
-__all__ = ['Blacklist', 'Whitelist', 'Patterns']
+__all__ = ['Blacklist', 'Whitelist', 'Patterns', 'Chain']
 
 class Blacklist(object):
     """
@@ -13,6 +12,7 @@ class Blacklist(object):
 
     def __init__(self):
         self.blacklist = set()
+        self.revision = 0
 
     def enable_component(self, component):
         """
@@ -24,6 +24,7 @@ class Blacklist(object):
         """
         try:
             self.blacklist.remove(_component_id(component))
+            self.revision += 1
         except KeyError:
             pass
 
@@ -37,6 +38,7 @@ class Blacklist(object):
         """
         component_id = _component_id(component)
         self.blacklist.add(component_id)
+        self.revision += 1
 
     def is_component_enabled(self, component):
         """
@@ -47,6 +49,15 @@ class Blacklist(object):
             return False
         return True
 
+    def decide(self, component):
+        """
+        returns False if the component has been disabled, 
+        otherwise None (no opinion).
+        """
+        if _component_id(component) in self.blacklist:
+            return False
+        return None
+
 class Whitelist(object):
     """
     Policy that activates only Components
@@ -55,6 +66,7 @@ class Whitelist(object):
 
     def __init__(self):
         self.whitelist = set()
+        self.revision = 0
 
     def enable_component(self, component):
         """
@@ -65,6 +77,7 @@ class Whitelist(object):
         a Component type or an instance of a Component.
         """
         self.whitelist.add(_component_id(component))
+        self.revision += 1
 
     def disable_component(self, component):
         """
@@ -76,6 +89,7 @@ class Whitelist(object):
         """
         try:
             self.whitelist.remove(_component_id(component))
+            self.revision += 1
         except KeyError:
             pass
 
@@ -86,6 +100,15 @@ class Whitelist(object):
         """
         return _component_id(component) in self.whitelist
 
+    def decide(self, component):
+        """
+        returns True if the component has been enabled, 
+        otherwise None (no opinion).
+        """
+        if _component_id(component) in self.whitelist:
+            return True
+        return None
+
 class Patterns(object):
     """
     A policy which enables and disables components
@@ -112,7 +135,8 @@ class Patterns(object):
         mgr.patterns.insert(0, pat)
         """
         if isinstance(pattern, basestring):
-            pattern = re.compile(fnmatch.translate(pattern))
+            from fnmatch import translate
+            pattern = re.compile(translate(pattern))
         return (pattern, enable)
 
     def append_pattern(self, pattern, enable):
@@ -123,12 +147,137 @@ class Patterns(object):
         pat = self.build_pattern(pattern, enable)
         self.patterns.append(pat)
 
+    @property
+    def revision(self):
+        # the pattern list is modified in place, so it is its own revision.
+        return tuple(self.patterns)
+
     def is_component_enabled(self, component):
-        enabled = False
+        return bool(self.decide(component))
+
+    def decide(self, component):
+        """
+        returns the state of the first pattern matching the 
+        component, or None if no pattern matches.
+        """
         comp_id = _component_id(component)
         for (pat, state) in self.patterns:
             if pat.match(comp_id) is not None:
-                enabled = state
-                break
-        return enabled
+                return state
+        return None
+
+class Chain(object):
+    """
+    A policy combining a list of other policies.  
+
+    mode is one of:
+    
+    'first' -- the first policy with an opinion about a component 
+               decides (see below), if none has one, default is used.
+    'all'   -- a component is enabled if every policy enables it.
+    'any'   -- a component is enabled if any policy enables it.
+    
+    A policy has an opinion about a component when its decide 
+    method returns True or False rather than None. Blacklist 
+    only has an opinion about the components it disables, Whitelist 
+    about those it enables and Patterns about those matching a 
+    pattern.  Policies without a decide method always have an 
+    opinion, given by is_component_enabled.
+    
+    Decisions are kept in a table by component id, which is filled 
+    in for all registered components by compile (or as components 
+    are looked up) and thrown away when the list of policies or 
+    any of their revisions change.  If a member policy has no 
+    revision attribute, decisions are not kept at all.
+    """
+    
+    MODES = ('first', 'all', 'any')
+
+    def __init__(self, policies=(), mode='first', default=False):
+        if mode not in self.MODES:
+            raise ValueError('unknown mode %r' % mode)
+        self.policies = list(policies)
+        self.mode = mode
+        self.default = default
+        self._table = {}
+        self._table_revision = None
+
+    @property
+    def revision(self):
+        revisions = []
+        for policy in self.policies:
+            revision = getattr(policy, 'revision', None)
+            if revision is None:
+                return None
+            revisions.append(revision)
+        return (tuple(id(p) for p in self.policies), tuple(revisions))
+
+    def append(self, policy):
+        """
+        add a policy to the end of the chain.
+        """
+        self.policies.append(policy)
+
+    def compile(self, components=None):
+        """
+        decide about each of the components given, by default 
+        every Component in every registry, ahead of time.
+        """
+        if components is None:
+            components = [cls for registry in ComponentMeta._registries.values()
+                          for cls in registry.components]
+        table = self._current_table()
+        if table is None:
+            return
+        for component in components:
+            comp_id = _component_id(component)
+            if comp_id not in table:
+                table[comp_id] = self._evaluate(component)
+
+    def is_component_enabled(self, component):
+        decision = self.decide(component)
+        if decision is None:
+            return bool(self.default)
+        return decision
+
+    def decide(self, component):
+        table = self._current_table()
+        if table is None:
+            return self._evaluate(component)
+        comp_id = _component_id(component)
+        try:
+            return table[comp_id]
+        except KeyError:
+            decision = table[comp_id] = self._evaluate(component)
+            return decision
+
+    def _current_table(self):
+        revision = self.revision
+        if revision is None:
+            return None
+        if revision != self._table_revision:
+            self._table = {}
+            self._table_revision = revision
+        return self._table
+
+    def _evaluate(self, component):
+        if self.mode == 'first':
+            for policy in self.policies:
+                decide = getattr(policy, 'decide', None)
+                if decide is None:
+                    return policy.is_component_enabled(component)
+                decision = decide(component)
+                if decision is not None:
+                    return decision
+            return None
+        elif self.mode == 'all':
+            for policy in self.policies:
+                if not policy.is_component_enabled(component):
+                    return False
+            return True
+        else:
+            for policy in self.policies:
+                if policy.is_component_enabled(component):
+                    return True
+            return False
 
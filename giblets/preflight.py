@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Pre-flight checks for plugins.  Each candidate plugin is imported in a
+helper process of its own, which is killed if the import takes longer
+than the timeout.  Only the plugins that loaded cleanly are then
+imported by the application itself.
+
+eg:
+preflight = Preflight(timeout=5, cache='/var/cache/myapp/preflight.json')
+find_plugins_in_path('/path/to/plugins', preflight=preflight)
+find_plugins_by_entry_point('myapp_plugins', preflight=preflight)
+
+Results are cached by the size and modification time of plugin files
+and the version of plugin distributions, so a plugin is only checked
+again when it changes.
+"""
+from collections import namedtuple
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+__all__ = ['Preflight', 'Result']
+
+import logging
+log = logging.getLogger(__name__)
+
+PREFLIGHT_FORMAT = 1
+
+class Result(namedtuple('Result', 'ok elapsed components error')):
+    """
+    The outcome of importing a plugin: whether it loaded, how long it
+    took (in seconds), the ids of the Components it registered and the
+    error if it did not load.
+    """
+    __slots__ = ()
+
+class Preflight(object):
+    """
+    Checks plugins in helper processes before they are imported.
+
+    timeout is the number of seconds each plugin is given to load,
+    jobs the number of helper processes run at once and cache the
+    name of a file in which to keep the results.
+    """
+
+    def __init__(self, timeout=10.0, jobs=4, cache=None):
+        self.timeout = timeout
+        self.jobs = jobs
+        self.cache = cache
+        self.results = {}
+
+    def check_files(self, files):
+        """
+        check the plugin source files given as (module name, path) pairs.
+        returns a dictionary of Results by path.
+        """
+        checks = []
+        for module_name, py_file in files:
+            st = os.stat(py_file)
+            checks.append((py_file, 'file:' + os.path.abspath(py_file),
+                           [st.st_mtime, st.st_size],
+                           ['file', module_name, py_file]))
+        return self._check(checks)
+
+    def check_entry_points(self, entries):
+        """
+        check the pkg_resources EntryPoints given.  returns a dictionary
+        of Results by EntryPoint.
+        """
+        checks = []
+        for entry in entries:
+            group = getattr(entry, 'group', None) or ''
+            dist = entry.dist
+            checks.append((entry, 'entry_point:%s:%s:%s' % (group, dist.project_name, entry.name),
+                           [dist.project_name, dist.version],
+                           ['entry_point', group, entry.name, dist.project_name]))
+        return self._check(checks)
+
+    def healthy_files(self, files):
+        """
+        the (module name, path) pairs given whose files loaded cleanly.
+        """
+        results = self.check_files(files)
+        return [(module_name, py_file) for module_name, py_file in files
+                if _healthy(py_file, results[py_file])]
+
+    def healthy_entry_points(self, entries):
+        """
+        the EntryPoints given that loaded cleanly.
+        """
+        results = self.check_entry_points(entries)
+        return [entry for entry in entries if _healthy(entry.name, results[entry])]
+
+    def _check(self, checks):
+        cached = self._load()
+        results = {}
+        pending = []
+        for thing, key, state, args in checks:
+            if key in cached and cached[key][0] == state:
+                results[thing] = Result(*cached[key][1])
+            else:
+                pending.append((thing, key, state, args))
+
+        if pending:
+            for (thing, key, state, args), result in zip(pending, self._run(pending)):
+                results[thing] = result
+                cached[key] = [state, list(result)]
+            self._save(cached)
+
+        self.results.update(results)
+        return results
+
+    def _run(self, pending):
+        """
+        run a helper process for each check, up to jobs at once,
+        killing any that run past the timeout.  The output of each
+        helper is read as it is written so that a plugin printing more
+        than the pipe holds does not block it.
+        """
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+        devnull = open(os.devnull, 'w')
+        try:
+            results = [None] * len(pending)
+            waiting = list(enumerate(pending))
+            running = []
+            while waiting or running:
+                while waiting and len(running) < max(self.jobs, 1):
+                    index, (thing, key, state, args) = waiting.pop(0)
+                    proc = subprocess.Popen([sys.executable, '-m', 'giblets.preflight'] + args,
+                                            stdout=subprocess.PIPE, stderr=devnull, env=env)
+                    running.append((index, proc, _Reader(proc.stdout), time.time()))
+                for index, proc, reader, started in list(running):
+                    elapsed = time.time() - started
+                    if proc.poll() is not None:
+                        results[index] = _read_result(proc, reader.output(), elapsed)
+                    elif elapsed > self.timeout:
+                        proc.kill()
+                        proc.wait()
+                        reader.output()
+                        results[index] = Result(False, elapsed, [],
+                                                'timed out after %.1f seconds' % self.timeout)
+                    else:
+                        continue
+                    running.remove((index, proc, reader, started))
+                time.sleep(0.01)
+            return results
+        finally:
+            devnull.close()
+
+    def _load(self):
+        if self.cache is None:
+            return {}
+        try:
+            f = open(self.cache)
+            try:
+                cached = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError), e:
+            log.debug("Unable to read preflight cache %s: %s" % (self.cache, e))
+            return {}
+        if cached.get('format') != PREFLIGHT_FORMAT:
+            return {}
+        return cached['results']
+
+    def _save(self, cached):
+        if self.cache is None:
+            return
+        try:
+            f = open(self.cache, 'w')
+            try:
+                json.dump({'format': PREFLIGHT_FORMAT, 'results': cached}, f,
+                          separators=(',', ':'), sort_keys=True)
+            finally:
+                f.close()
+        except IOError, e:
+            log.warning("Unable to write preflight cache %s: %s" % (self.cache, e))
+
+def _healthy(name, result):
+    if not result.ok:
+        log.error("Not loading plugin %s, it failed its preflight check: %s" %
+                  (name, result.error))
+    return result.ok
+
+class _Reader(object):
+    """
+    collects everything written to a pipe on a thread of its own.
+    """
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.chunks = []
+        self.thread = threading.Thread(target=self._read)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read(self):
+        try:
+            for chunk in iter(lambda: self.pipe.read(65536), ''):
+                self.chunks.append(chunk)
+        finally:
+            self.pipe.close()
+
+    def output(self):
+        """
+        everything written to the pipe, once it has been closed.
+        """
+        self.thread.join()
+        return ''.join(self.chunks)
+
+def _read_result(proc, out, elapsed):
+    try:
+        return Result(*json.loads(out.strip().splitlines()[-1]))
+    except (ValueError, IndexError, TypeError):
+        return Result(False, elapsed, [],
+                      'helper process exited with status %s' % proc.returncode)
+
+def _load_file(module_name, py_file):
+    import imp
+    imp.load_source(module_name, py_file)
+
+def _load_entry_point(group, name, project_name):
+    from pkg_resources import working_set
+    for entry in working_set.iter_entry_points(group, name):
+        if entry.dist.project_name == project_name:
+            entry.load(require=True)
+            return
+    raise ImportError('entry point %s not found in %s' % (name, project_name))
+
+def main(argv):
+    """
+    import the plugin described by argv in this process and write its
+    Result, as JSON, to stdout.
+    """
+    from giblets.core import _component_id, _rollback_on_failure
+    out = sys.stdout
+    # anything the plugin prints goes to stderr instead.
+    sys.stdout = sys.stderr
+
+    kind, args = argv[1], argv[2:]
+    load = {'file': _load_file, 'entry_point': _load_entry_point}[kind]
+    start = time.time()
+    journal = _rollback_on_failure()
+    try:
+        with journal:
+            load(*args)
+        result = Result(True, time.time() - start,
+                        [_component_id(cls) for cls in journal.registered], None)
+    except:
+        result = Result(False, time.time() - start, [], traceback.format_exc())
+    out.write(json.dumps(list(result)) + '\n')
+    out.flush()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Support for Components that run in worker processes. 
+
+A Component class declaring scope = 'process' is never instantiated 
+in the process using it.  Instead, its ComponentManager starts 
+'processes' (default 2) worker processes, each with its own instance 
+of the Component, and hands out a ComponentProxy which forwards method 
+calls to the workers.  Arguments and results must be picklable.
+
+Workers that die are restarted; the call that was in progress raises 
+an ExtensionError.  ComponentManager.shutdown stops all workers.
+"""
+import itertools
+import multiprocessing
+import pickle
+import threading
+import traceback
+
+from giblets.core import ComponentManager, ExtensionError, _component_id
+
+__all__ = ['ComponentProxy', 'ProcessPool']
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_PROCESSES = 2
+
+class _WorkerManager(ComponentManager):
+    """
+    The ComponentManager of a worker process, where process scoped
+    Components are instantiated for real.
+    """
+    def _process_proxy(self, cls):
+        return None
+
+def _serve(conn, cls, registries):
+    mgr = _WorkerManager(registries=registries)
+    component = cls(mgr)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        method, calls = request
+        try:
+            func = getattr(component, method)
+            reply = ('ok', [func(*args, **kwargs) for args, kwargs in calls])
+        except Exception, e:
+            tb = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = None
+            reply = ('error', (e, tb))
+        conn.send(reply)
+
+class _Worker(object):
+
+    def __init__(self, cls, registries):
+        self.cls = cls
+        self.registries = registries
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, 
+                                               args=(child_conn, self.cls, 
+                                                     self.registries))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.conn = conn
+
+    def restart(self):
+        log.warning("Restarting worker process for %s" % 
+                    _component_id(self.cls))
+        self.stop()
+        self.start()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def send(self, method, calls):
+        try:
+            self.conn.send((method, calls))
+        except (IOError, OSError), e:
+            self._crashed(e)
+
+    def receive(self):
+        try:
+            status, value = self.conn.recv()
+        except (EOFError, IOError, OSError), e:
+            self._crashed(e)
+        if status == 'ok':
+            return value
+        error, tb = value
+        if error is None:
+            raise ExtensionError('Error in worker process for %s:\n%s' % 
+                                 (_component_id(self.cls), tb))
+        raise error
+
+    def discard_reply(self):
+        """
+        read and ignore the reply to a request, restarting the 
+        worker if it can't be read.
+        """
+        try:
+            self.conn.recv()
+        except Exception:
+            self.restart()
+
+    def _crashed(self, e):
+        self.restart()
+        raise ExtensionError('Worker process for %s died (%s)' % 
+                             (_component_id(self.cls), e))
+
+class ProcessPool(object):
+    """
+    The worker processes running a process scoped Component.
+    """
+
+    def __init__(self, cls, registries, processes):
+        self.cls = cls
+        self.workers = [_Worker(cls, registries) for i in range(processes)]
+        self._next = itertools.cycle(self.workers)
+        self._next_lock = threading.Lock()
+
+    def call(self, method, args, kwargs):
+        """
+        call method on the Component in one of the workers.
+        """
+        self._next_lock.acquire()
+        try:
+            worker = self._next.next()
+        finally:
+            self._next_lock.release()
+        worker.lock.acquire()
+        try:
+            worker.send(method, [(args, kwargs)])
+            return worker.receive()[0]
+        finally:
+            worker.lock.release()
+
+    def batch(self, method, items, batched=False):
+        """
+        call method once for each argument in items, spreading 
+        the calls over all of the workers. returns the list of 
+        results in the order of items.
+
+        If batched is True, method takes a list of items and returns 
+        the list of their results, and each worker calls it once with 
+        its share of the items.
+        """
+        items = list(items)
+        workers = self.workers
+        chunks = [items[i::len(workers)] for i in range(len(workers))]
+        busy = [(w, c) for w, c in zip(workers, chunks) if c]
+        for worker, chunk in busy:
+            worker.lock.acquire()
+        try:
+            replies = []
+            error = None
+            sent = []
+            for worker, chunk in busy:
+                if batched:
+                    calls = [((chunk,), {})]
+                else:
+                    calls = [((arg,), {}) for arg in chunk]
+                try:
+                    worker.send(method, calls)
+                except Exception, e:
+                    error = e
+                    break
+                sent.append((worker, chunk))
+            # every worker that was sent a chunk owes a reply, which 
+            # must be read even if the batch has failed, or it would 
+            # be taken for the reply to the next call.
+            for worker, chunk in sent:
+                if error is not None:
+                    worker.discard_reply()
+                    continue
+                try:
+                    reply = worker.receive()
+                except Exception, e:
+                    error = e
+                    continue
+                if batched:
+                    reply = list(reply[0])
+                    if len(reply) != len(chunk):
+                        error = ExtensionError('%s.%s returned %d results for %d items' % 
+                                               (_component_id(self.cls), method, 
+                                                len(reply), len(chunk)))
+                replies.append(reply)
+            if error is not None:
+                raise error
+        finally:
+            for worker, chunk in busy:
+                worker.lock.release()
+
+        results = [None] * len(items)
+        for i, reply in enumerate(replies):
+            results[i::len(workers)] = reply
+        return results
+
+    def close(self):
+        for worker in self.workers:
+            worker.lock.acquire()
+            try:
+                worker.stop()
+            finally:
+                worker.lock.release()
+
+class ComponentProxy(object):
+    """
+    Stands in for a process scoped Component.  Calling a method 
+    of the proxy calls the method of the Component in a worker 
+    process and returns the result.
+    """
+
+    def __init__(self, cls, compmgr, processes=None):
+        if processes is None:
+            processes = getattr(cls, 'processes', DEFAULT_PROCESSES)
+        self.__dict__['component_class'] = cls
+        self.__dict__['compmgr'] = compmgr
+        self.__dict__['pool'] = ProcessPool(cls, compmgr.registries, processes)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        pool = self.pool
+        def call(*args, **kwargs):
+            return pool.call(name, args, kwargs)
+        call.__name__ = name
+        return call
+
+    def __setattr__(self, name, value):
+        raise AttributeError('cannot set attributes of a process scoped Component')
+
+    def __repr__(self):
+        return '<ComponentProxy %s>' % _component_id(self.component_class)
+
+    def batch(self, method, items, batched=False):
+        """
+        call method with each of the items given, spread across the 
+        worker processes, returning a list of the results.  With 
+        batched, method takes a list of items and is called once per 
+        worker (see ProcessPool.batch).
+        """
+        return self.pool.batch(method, items, batched)
+
+    def close(self):
+        """
+        stop the worker processes.
+        """
+        self.pool.close()
@@ -17,58 +17,577 @@
 #         Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+from collections import namedtuple
 from glob import glob
 import imp
 import os
 import sys
+import time
 import traceback
 
-__all__ = ['find_plugins_in_path', 'find_plugins_by_entry_point']
+__all__ = ['find_plugins_in_path', 'find_plugins_in_tree', 'find_plugins_in_bundle', 
+           'find_plugins_by_entry_point', 'iter_plugins_in_path', 'iter_plugins_in_tree',
+           'iter_plugins_in_bundle', 'iter_plugins_by_entry_point', 'Discovery']
 
 import logging 
 log = logging.getLogger(__name__)
 
-def find_plugins_in_path(search_path):
+# (mtime, size) of each plugin source file as of when it was last loaded
+# by find_plugins_in_path, keyed by absolute path.
+_loaded_sources = {}
+
+# (mtime, size) of each bundle as of when it was last loaded by
+# find_plugins_in_bundle, keyed by path.
+_loaded_bundles = {}
+
+# (mtime, subdirectory names, file names) of each directory as of when
+# it was last listed by find_plugins_in_tree, keyed by path.
+_scanned_dirs = {}
+
+class Discovery(namedtuple('Discovery', 'name source components interfaces elapsed error')):
+    """
+    What loading a plugin module or entry point added: its name, the 
+    file, bundle or distribution location it came from, the Component 
+    types it registered, the ExtensionInterfaces they implement, the 
+    time taken in seconds and, if it failed to load, the formatted 
+    exception (its Components are unregistered again in that case).
+    """
+    __slots__ = ()
+
+def _discover(name, source, load, *args):
+    """
+    call load(*args), returning a Discovery of what it registered.
+    """
+    from giblets.core import _rollback_on_failure
+
+    start = time.time()
+    journal = _rollback_on_failure()
+    try:
+        with journal:
+            load(*args)
+    except:
+        error = traceback.format_exc()
+        log.error("Error loading %s from %s: %s" % (name, source, error))
+        return Discovery(name, source, [], [], time.time() - start, error)
+    return _discovered(name, source, journal.registered, time.time() - start)
+
+def _discovered(name, source, components, elapsed):
+    from giblets.core import implemented_by
+
+    interfaces = []
+    for cls in components:
+        for interface in implemented_by(cls):
+            if not interface in interfaces:
+                interfaces.append(interface)
+    return Discovery(name, source, list(components), interfaces, elapsed, None)
+
+def find_plugins_in_path(search_path, reload=False, preflight=None):
     """
     Discover plugins in any .py files in the given on-disk locations eg:
     
     find_plugins_in_path("/path/to/mymodule/plugins")
     find_plugins_in_path(["/path/to/mymodule/plugins", "/some/more/plugins"])
     
+    If reload is True, modules previously loaded from the search path
+    whose files have changed since they were loaded are executed again 
+    and their Components take the place of the old ones in the registry.
+
+    If preflight is given (a giblets.preflight.Preflight), new modules 
+    are first checked in helper processes and only those that load 
+    cleanly are loaded here.  Components registered by a module that 
+    fails to load are unregistered again.
+    """
+    for discovery in iter_plugins_in_path(search_path, reload, preflight):
+        pass
+
+def iter_plugins_in_path(search_path, reload=False, preflight=None):
+    """
+    like find_plugins_in_path, but yields a Discovery for each module
+    as it is loaded (or reloaded).
     """
     if isinstance(search_path, basestring):
         search_path = [search_path]
 
     for path in search_path:
         log.debug("searching for plugins in %s" % search_path)
+        candidates = []
         for py_file in glob(os.path.join(path, '*.py')):
-            try:
-                module_name = os.path.basename(py_file[:-3])
-                # if it's already loaded, move on 
-                if module_name in sys.modules:
-                    continue
-                
-                log.debug("Loading module %s" % py_file)
-                module = imp.load_source(module_name, py_file)
-            except:
-                log.error("Error loading module %s: %s" % (os.path.join(path, py_file), traceback.format_exc()))
+            module_name = os.path.basename(py_file[:-3])
+            # if it's already loaded, move on 
+            if module_name in sys.modules:
+                if reload and _source_changed(py_file):
+                    yield _discover(module_name, py_file, _reload_source, module_name, py_file)
+                continue
+            candidates.append((module_name, py_file))
+
+        if preflight is not None and candidates:
+            candidates = preflight.healthy_files(candidates)
+        for module_name, py_file in candidates:
+            yield _discover(module_name, py_file, _load_source, module_name, py_file)
+
+def _load_source(module_name, py_file):
+    log.debug("Loading module %s" % py_file)
+    # an absolute __file__ stays valid if the working directory changes.
+    py_file = os.path.abspath(py_file)
+    state = _source_state(py_file)
+    module = imp.load_source(module_name, py_file)
+    _loaded_sources[py_file] = state
+    return module
+
+def find_plugins_in_tree(root, package=None, include=('*.py',), exclude=(), reload=False):
+    """
+    Discover plugins in .py files anywhere below the directory root eg:
+
+    find_plugins_in_tree("/path/to/plugins", exclude=['tests', '*_test.py'])
+
+    Subdirectories are loaded as packages, so root/tools/brush.py
+    becomes the module tools.brush, and files with the same name in
+    different directories don't collide.  Directories without an 
+    __init__.py get an empty package module.  If package is given, 
+    root itself is loaded as that package (tools.brush becomes 
+    package.tools.brush), otherwise the files directly in root are 
+    loaded as top-level modules.
+
+    include and exclude are fnmatch patterns matched against the name
+    of each file or directory and its path relative to root (with / 
+    as separator).  Files are loaded if they match an include pattern 
+    and no exclude pattern, directories matching an exclude pattern are
+    skipped along with everything in them.
+
+    Directories whose modification time has not changed since they were 
+    last scanned are not listed again, so repeated calls on a large tree 
+    cost about one stat per directory.  reload works as it does for 
+    find_plugins_in_path.
+    """
+    for discovery in iter_plugins_in_tree(root, package, include, exclude, reload):
+        pass
+
+def iter_plugins_in_tree(root, package=None, include=('*.py',), exclude=(), reload=False):
+    """
+    like find_plugins_in_tree, but yields a Discovery for each module
+    (or package __init__.py) as it is loaded (or reloaded).
+    """
+    if isinstance(include, basestring):
+        include = [include]
+    if isinstance(exclude, basestring):
+        exclude = [exclude]
+    return _scan_tree(os.path.abspath(root), '', package, include, exclude, reload, set())
+
+def _scan_tree(path, relpath, package, include, exclude, reload, visited):
+    from fnmatch import fnmatch
+
+    def matches(name, patterns):
+        rel = relpath + name
+        for pattern in patterns:
+            if fnmatch(name, pattern) or fnmatch(rel, pattern):
+                return True
+        return False
+
+    try:
+        st = os.stat(path)
+    except OSError, e:
+        log.error("Unable to search %s for plugins: %s" % (path, e))
+        return
+    # directories reached again through symlinks are only searched 
+    # once, which also keeps a link to a parent from looping forever.
+    if (st.st_dev, st.st_ino) in visited:
+        log.debug("Not searching %s for plugins again" % path)
+        return
+    visited.add((st.st_dev, st.st_ino))
+    mtime = st.st_mtime
+    scanned = _scanned_dirs.get(path)
+    if scanned is None or scanned[0] != mtime:
+        log.debug("searching for plugins in %s" % path)
+        dirs, files = _list_dir(path)
+        scanned = _scanned_dirs[path] = (mtime, dirs, files)
+    mtime, dirs, files = scanned
+
+    if package:
+        module = sys.modules.get(package)
+        if module is None:
+            if '__init__.py' in files:
+                init = os.path.join(path, '__init__.py')
+                discovery = _discover(package, init, _load_package, package, path)
+                yield discovery
+                if discovery.error is not None:
+                    return
+            else:
+                _empty_package(package, path)
+        elif not path in [os.path.abspath(p) for p in getattr(module, '__path__', [])]:
+            log.error("Not searching %s for plugins, %s is already loaded from elsewhere" % 
+                      (path, package))
+            return
+
+    for name in files:
+        if name == '__init__.py' or not name.endswith('.py'):
+            continue
+        base = name[:-3]
+        module_name = package and '%s.%s' % (package, base) or base
+        # modules loaded by an earlier call are skipped before 
+        # anything else, to keep rescans of unchanged trees cheap.
+        if module_name in sys.modules:
+            py_file = os.path.join(path, name)
+            if reload and _source_changed(py_file):
+                yield _discover(module_name, py_file, _reload_source, module_name, py_file)
+            continue
+        if not matches(name, include) or matches(name, exclude):
+            continue
+        py_file = os.path.join(path, name)
+        if not _is_identifier(base):
+            log.debug("Skipping %s, not a valid module name" % py_file)
+            continue
+        discovery = _discover(module_name, py_file, _load_source, module_name, py_file)
+        if discovery.error is None and package:
+            setattr(sys.modules[package], base, sys.modules[module_name])
+        yield discovery
+
+    for name in dirs:
+        if not _is_identifier(name) or matches(name, exclude):
+            continue
+        subdir = os.path.join(path, name)
+        subpackage = package and '%s.%s' % (package, name) or name
+        for discovery in _scan_tree(subdir, relpath + name + '/', subpackage, 
+                                    include, exclude, reload, visited):
+            yield discovery
+
+def _load_package(name, path):
+    log.debug("Loading package %s" % path)
+    module = imp.load_module(name, None, path, ('', '', imp.PKG_DIRECTORY))
+    _set_in_parent(name, module)
+    return module
+
+def _empty_package(name, path):
+    """
+    an empty package module standing in for a directory with no __init__.py
+    """
+    module = imp.new_module(name)
+    module.__path__ = [path]
+    sys.modules[name] = module
+    _set_in_parent(name, module)
+    return module
+
+def _set_in_parent(name, module):
+    parent, dot, child = name.rpartition('.')
+    if parent in sys.modules:
+        setattr(sys.modules[parent], child, module)
+
+def _list_dir(path):
+    """
+    the sorted names of the subdirectories and files in path.
+    """
+    dirs = []
+    files = []
+    if _scandir is not None:
+        for entry in _scandir(path):
+            if entry.is_dir():
+                dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+    else:
+        for name in os.listdir(path):
+            if os.path.isdir(os.path.join(path, name)):
+                dirs.append(name)
+            else:
+                files.append(name)
+    dirs.sort()
+    files.sort()
+    return dirs, files
 
+try:
+    _scandir = os.scandir
+except AttributeError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+def _is_identifier(name):
+    return name and not name[0].isdigit() and name.replace('_', 'a').isalnum()
+
+def find_plugins_in_bundle(bundles, reload=False):
+    """
+    Discover plugins in the modules at the top level of the given zip 
+    bundles (see giblets.bundle) eg:
+
+    find_plugins_in_bundle("/path/to/plugins.zip")
+    find_plugins_in_bundle(["/path/to/plugins.zip", "/some/more/plugins.zip"])
+
+    The modules are loaded with zipimport, so each bundle is opened once 
+    and each module found through the archive's index.  Modules already 
+    loaded are skipped, as with find_plugins_in_path.  If reload is True
+    and a bundle has changed since it was loaded, the modules that came 
+    from it are executed again and their Components take the place of 
+    the old ones in the registry.
+    """
+    for discovery in iter_plugins_in_bundle(bundles, reload):
+        pass
+
+def iter_plugins_in_bundle(bundles, reload=False):
+    """
+    like find_plugins_in_bundle, but yields a Discovery for each module
+    as it is loaded (or reloaded).
+    """
+    import zipimport
+
+    if isinstance(bundles, basestring):
+        bundles = [bundles]
+
+    for bundle in bundles:
+        bundle = os.path.abspath(bundle)
+        log.debug("searching for plugins in %s" % bundle)
+        try:
+            state = _source_state(bundle)
+        except OSError, e:
+            log.error("Unable to open plugin bundle %s: %s" % (bundle, e))
+            continue
+        changed = reload and bundle in _loaded_bundles and \
+                  _loaded_bundles[bundle] != state
+        if changed:
+            # zipimport keeps the index of each archive it has opened.
+            zipimport._zip_directory_cache.pop(bundle, None)
+        try:
+            importer = zipimport.zipimporter(bundle)
+        except zipimport.ZipImportError, e:
+            log.error("Unable to open plugin bundle %s: %s" % (bundle, e))
+            continue
+        if changed or not bundle in _loaded_bundles:
+            _loaded_bundles[bundle] = state
+
+        for module_name in _bundle_modules(importer):
+            module = sys.modules.get(module_name)
+            if module is not None:
+                if changed and getattr(module, '__loader__', None) is not None and \
+                        getattr(module.__loader__, 'archive', None) == bundle:
+                    yield _discover(module_name, bundle, _reload_from_bundle, 
+                                    importer, module_name)
+                continue
+            yield _discover(module_name, bundle, _load_from_bundle, importer, module_name)
+
+def _bundle_modules(importer):
+    """
+    the names of the modules at the top level of a bundle.
+    """
+    files = getattr(importer, '_files', None)
+    if files is None:
+        import zipfile
+        archive = zipfile.ZipFile(importer.archive)
+        try:
+            files = archive.namelist()
+        finally:
+            archive.close()
+    names = set()
+    for path in files:
+        base, ext = os.path.splitext(path)
+        if ext in ('.py', '.pyc', '.pyo') and not '/' in base and \
+                not os.sep in base and _is_identifier(base):
+            names.add(base)
+    return sorted(names)
+
+def _load_from_bundle(importer, module_name):
+    log.debug("Loading module %s from %s" % (module_name, importer.archive))
+    return importer.load_module(module_name)
+
+def _reload_from_bundle(importer, module_name):
+    log.debug("Reloading module %s from %s" % (module_name, importer.archive))
+    _reload(module_name, importer.load_module, module_name)
+
+def _source_state(py_file):
+    st = os.stat(py_file)
+    return (st.st_mtime, st.st_size)
+
+def _source_changed(py_file):
+    # only files that were loaded by us are candidates for reloading.
+    py_file = os.path.abspath(py_file)
+    if py_file not in _loaded_sources:
+        return False
+    return _source_state(py_file) != _loaded_sources[py_file]
+
+def _reload_source(module_name, py_file):
+    log.debug("Reloading module %s" % py_file)
+    py_file = os.path.abspath(py_file)
+    state = _source_state(py_file)
+    # make sure the source is recompiled even if it changed 
+    # within the resolution of the bytecode timestamp.
+    try:
+        os.remove(py_file + 'c')
+    except OSError:
+        pass
+    try:
+        _reload(module_name, imp.load_source, module_name, py_file)
+    finally:
+        _loaded_sources[py_file] = state
+
+def _reload(module_name, load, *args):
+    """
+    execute a plugin module again with load(*args).  Its new Components
+    take the place of the old ones only if it loads without error,
+    otherwise the old module and Components are left as they were.
+    """
+    from giblets.core import _module_components, _replace_components
+
+    module = sys.modules.get(module_name)
+    old_classes = _module_components(module_name)
+    try:
+        load(*args)
+    except:
+        log.error("Unable to reload %s, keeping the Components it defined before" % 
+                  module_name)
+        # a module that fails to execute is dropped from sys.modules.
+        if module is not None:
+            sys.modules[module_name] = module
+        raise
+    _replace_components(old_classes)
 
 
 try:
     from pkg_resources import working_set as master_working_set
 
-    def find_plugins_by_entry_point(entry_point_id, ws=master_working_set):
-        for entry in ws.iter_entry_points(entry_point_id):
-            log.debug('Loading plugin %s from %s', entry.name, entry.dist.location)
+    def find_plugins_by_entry_point(entry_point_id, ws=master_working_set, 
+                                    resolution_cache=None, preflight=None):
+        """
+        Discover plugins advertised by the entry points named entry_point_id
+        in the working set given.
+        
+        The requirements of each plugin distribution are resolved once per 
+        call.  If resolution_cache names a file, the resolutions are saved 
+        there and reused by later calls for as long as the distributions in 
+        the working set (and their versions) stay the same.
+        
+        If preflight is given (a giblets.preflight.Preflight), the plugins 
+        are first checked in helper processes and only those that load 
+        cleanly are loaded here.
 
-            try:
-                entry.load(require=True)
-            except:
-                import traceback
-                log.error("Error loading plugin %s from %s: %s" % (entry.name, entry.dist.location, traceback.format_exc()))
+        The entry points are imported one after another.  On Python 2 the 
+        import lock lets only one thread import at a time, so importing 
+        them on several threads would not finish any sooner.
+        """
+        for discovery in iter_plugins_by_entry_point(entry_point_id, ws, 
+                                                     resolution_cache, preflight):
+            pass
+
+    def iter_plugins_by_entry_point(entry_point_id, ws=master_working_set, 
+                                    resolution_cache=None, preflight=None):
+        """
+        like find_plugins_by_entry_point, but yields a Discovery for each 
+        entry point, in entry point order, as soon as it has loaded.
+        """
+        entries = list(ws.iter_entry_points(entry_point_id))
+        if preflight is not None and entries:
+            entries = preflight.healthy_entry_points(entries)
+        requirements = _Requirements(ws, resolution_cache)
+        try:
+            for entry in entries:
+                log.debug('Loading plugin %s from %s', entry.name, entry.dist.location)
+                yield _discover(entry.name, entry.dist.location, _load_entry, 
+                                requirements, entry)
+        finally:
+            requirements.save()
         
 except ImportError:
     
-    def find_plugins_by_entry_point(entry_point_id, ws=None):
-        log.warning("Not loading plugins from eggs, setuptools not found.")
\ No newline at end of file
+    def find_plugins_by_entry_point(entry_point_id, ws=None, 
+                                    resolution_cache=None, preflight=None):
+        log.warning("Not loading plugins from eggs, setuptools not found.")
+
+    def iter_plugins_by_entry_point(entry_point_id, ws=None, 
+                                    resolution_cache=None, preflight=None):
+        log.warning("Not loading plugins from eggs, setuptools not found.")
+        return iter([])
+
+RESOLUTION_CACHE_FORMAT = 1
+
+class _Requirements(object):
+    """
+    resolves the requirements of plugin distributions into a working 
+    set, remembering the distributions each one needed.
+    """
+
+    def __init__(self, ws, filename=None):
+        self.ws = ws
+        self.filename = filename
+        self.resolved = {}
+        self.cached = {}
+        self.changed = False
+        if filename is not None:
+            self.signature = sorted([dist.project_name, dist.version] for dist in ws)
+            self.cached = self._load()
+
+    def _load(self):
+        import json
+        try:
+            f = open(self.filename)
+            try:
+                cache = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError), e:
+            log.debug("Unable to read resolution cache %s: %s" % (self.filename, e))
+            return {}
+        if cache.get('format') != RESOLUTION_CACHE_FORMAT or \
+                cache.get('working_set') != self.signature:
+            log.debug("Resolution cache %s is out of date" % self.filename)
+            self.changed = True
+            return {}
+        return cache['resolved']
+
+    def save(self):
+        if self.filename is None or not self.changed:
+            return
+        import json
+        resolved = dict(self.cached)
+        for key, dists in self.resolved.items():
+            resolved[key] = [[dist.project_name, dist.version] for dist in dists]
+        cache = {'format': RESOLUTION_CACHE_FORMAT, 
+                 'working_set': self.signature, 
+                 'resolved': resolved}
+        try:
+            f = open(self.filename, 'w')
+            try:
+                json.dump(cache, f, separators=(',', ':'), sort_keys=True)
+            finally:
+                f.close()
+        except IOError, e:
+            log.warning("Unable to write resolution cache %s: %s" % (self.filename, e))
+
+    def require(self, entry):
+        """
+        make sure the requirements of entry's distribution are in the
+        working set.
+        """
+        dist = entry.dist
+        key = '%s==%s%s' % (dist.project_name, dist.version, 
+                            ''.join('[%s]' % extra for extra in sorted(entry.extras)))
+        dists = self.resolved.get(key)
+        if dists is None:
+            dists = self._cached_dists(key)
+            if dists is None:
+                dists = self.ws.resolve(dist.requires(entry.extras), extras=entry.extras)
+                self.changed = True
+            for required in dists:
+                self.ws.add(required)
+            self.resolved[key] = dists
+        return dists
+
+    def _cached_dists(self, key):
+        # the cached resolution is only used if every distribution 
+        # it names is still in the working set at the same version.
+        names = self.cached.get(key)
+        if names is None:
+            return None
+        dists = []
+        for project_name, version in names:
+            dist = self.ws.by_key.get(project_name.lower())
+            if dist is None or dist.version != version:
+                return None
+            dists.append(dist)
+        return dists
+
+def _import_entry(entry):
+    if hasattr(entry, 'resolve'):
+        entry.resolve()
+    else:
+        entry.load(require=False)
+
+def _load_entry(requirements, entry):
+    requirements.require(entry)
+    _import_entry(entry)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Profile-guided warm up.  A UsageProfile records the order in which 
+a ComponentManager activates Components and how often each is used.  
+On the next start, warm_up activates the Components that were used 
+the most, in the order they were first needed, so that they are ready
+before the first request arrives.  Components that were not used 
+stay lazy.
+"""
+import json
+import threading
+
+from giblets.core import _component_id, get_registry, POOLED
+
+__all__ = ['UsageProfile', 'warm_up']
+
+import logging
+log = logging.getLogger(__name__)
+
+class UsageProfile(object):
+    """
+    Records Component activation order and access counts by component id.
+    
+    eg:
+    profile = UsageProfile()
+    mgr.record_usage(profile)
+    ... serve traffic ...
+    mgr.record_usage(None)
+    profile.save('/var/lib/myapp/usage.json')
+    """
+
+    def __init__(self, activations=(), accesses=None):
+        self.activations = list(activations)
+        self.accesses = dict(accesses or {})
+
+    def activated(self, component_id):
+        self.activations.append(component_id)
+
+    def accessed(self, component_id):
+        self.accesses[component_id] = self.accesses.get(component_id, 0) + 1
+
+    def hot(self, limit=None, min_accesses=1):
+        """
+        the ids of Components accessed at least min_accesses times, in 
+        the order they were activated.  If limit is given, only the 
+        limit most accessed are included.
+        """
+        seen = set()
+        hot = []
+        for component_id in self.activations:
+            if component_id in seen:
+                continue
+            seen.add(component_id)
+            if self.accesses.get(component_id, 0) >= min_accesses:
+                hot.append(component_id)
+        if limit is not None and len(hot) > limit:
+            keep = set(sorted(hot, key=lambda c: -self.accesses[c])[:limit])
+            hot = [c for c in hot if c in keep]
+        return hot
+
+    def save(self, filename):
+        f = open(filename, 'w')
+        try:
+            json.dump({'activations': self.activations,
+                       'accesses': self.accesses}, f, separators=(',', ':'))
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, filename):
+        f = open(filename)
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        return cls(data['activations'], data['accesses'])
+
+def warm_up(mgr, profile, limit=None, min_accesses=1, background=False):
+    """
+    activate the hot Components of the profile given (a UsageProfile 
+    or the name of a file it was saved to) in the ComponentManager 
+    given, in the order they were activated when the profile was 
+    recorded.  Components that are not registered or are disabled by 
+    the manager's policy are skipped.
+    
+    If background is True, the Components are activated by a daemon 
+    thread, which is returned.  Otherwise the list of activated 
+    Components is returned.
+    """
+    if not isinstance(profile, UsageProfile):
+        profile = UsageProfile.load(profile)
+
+    by_id = {}
+    for name in mgr.registries:
+        for cls in get_registry(name).components:
+            by_id[_component_id(cls)] = cls
+    # pooled Components are only made by leases, there is nothing to warm.
+    classes = [by_id[c] for c in profile.hot(limit, min_accesses) 
+               if c in by_id and getattr(by_id[c], 'scope', None) != POOLED]
+
+    def activate_all():
+        activated = []
+        for cls in classes:
+            try:
+                component = mgr._get_instance_of(cls)
+            except:
+                log.exception("Error warming up %s" % _component_id(cls))
+                continue
+            if component is not None:
+                activated.append(component)
+        return activated
+
+    if background:
+        thread = threading.Thread(target=activate_all, name='giblets-warm-up')
+        thread.daemon = True
+        thread.start()
+        return thread
+    return activate_all()
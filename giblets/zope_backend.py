@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+"""
+Interface backend built on zope.interface.  This is the default
+backend; interfaces and declarations are plain zope.interface
+objects and may be mixed freely with other zope.interface code.
+"""
+import sys
+
+from zope import interface as zi
+from zope.interface import Attribute, Interface
+
+##############################################################################
+# XXX monkey patch for mixing with zope.interface
+# this monkey patch allows us to attach an additional class advisor that
+# is executed after the class advisor generated by any of the implements()
+# type declarations. The class advisor allows us to register the interfaces
+# that are set up by the zope.interface class advisor.
+# To keep 'import giblets' cheap, the patch (and zope.interface.advice)
+# is only installed when the first Component class is defined.
+def _patched_implements(name, interfaces, classImplements):
+    from zope.interface.advice import addClassAdvisor
+    from zope.interface.declarations import _implements_advice
+    frame = sys._getframe(2)
+    locals = frame.f_locals
+
+    # Try to make sure we were called from a class def. In 2.2.0 we can't
+    # check for __module__ since it doesn't seem to be added to the locals
+    # until later on.
+    if (locals is frame.f_globals) or (
+        ('__module__' not in locals) and sys.version_info[:3] > (2, 2, 0)):
+        raise TypeError(name+" can be used only from a class definition.")
+
+    if '__implements_advice_data__' in locals:
+        raise TypeError(name+" can be used only once in a class definition.")
+
+    locals['__implements_advice_data__'] = interfaces, classImplements
+    addClassAdvisor(_implements_advice, depth=3)
+    addClassAdvisor(_register, depth=3)
+
+def _register(cls):
+    # classes declaring interfaces before the first Component is 
+    # defined can't be Components, there is nothing to register.
+    if _registrar is None:
+        return cls
+    return _registrar(cls)
+
+_registrar = None
+def install(registrar):
+    """
+    install the class advisor patch.  registrar is called with each
+    class once zope.interface has finished with its declarations.
+    """
+    global _registrar
+    if _registrar is None:
+        from zope.interface import declarations
+        declarations._implements = _patched_implements
+        _registrar = registrar
+###############################################################################
+
+def implements(*interfaces):
+    """
+    Declare a list of ExtensionInterfaces implemented by a
+    Component.
+    """
+    _patched_implements("implements", interfaces, zi.classImplements)
+
+
+def implements_only(*interfaces):
+    """
+    declare that a Component implements exactly the list
+    of ExtensionInterfaces specified, overriding any
+    inherited declarations of implemented ExtensionInterfaces.
+    """
+    _patched_implements("implementsOnly", interfaces, zi.classImplementsOnly)
+
+def class_implements(cls, interfaces):
+    """
+    declare interfaces implemented by cls after it has been defined.
+    """
+    zi.classImplements(cls, *interfaces)
+
+def class_defined(cls):
+    """
+    returns True if the registrar will be called for cls by a
+    class advisor, False if it should be registered now.
+    """
+    return '__implements_advice_data__' in cls.__dict__
+
+def declared_interfaces(cls):
+    """
+    the interfaces declared by cls or inherited declarations.
+    """
+    return zi.implementedBy(cls).interfaces()
+
+def class_iro(cls):
+    """
+    every interface implemented by instances of cls, most specific first.
+    """
+    return zi.implementedBy(cls).__iro__
+
+def object_iro(obj):
+    """
+    every interface provided by obj, most specific first.
+    """
+    return zi.providedBy(obj).__iro__
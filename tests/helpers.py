@@ -9,5 +9,4 @@ def has_exactly(k, T, l):
 
 def clear_registry():
     from giblets.core import ComponentMeta
-    ComponentMeta._registry = {}
-    ComponentMeta._components = []
+    ComponentMeta._registries = {}
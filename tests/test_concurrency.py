@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+from helpers import *
+
+THREADS = 16
+
+def hammer(threads, func):
+    """
+    call func(index) in the given number of threads, all started at
+    once, and re-raise the first error any of them hit.
+    """
+    import sys
+    import threading
+
+    start = threading.Event()
+    errors = []
+    def run(index):
+        start.wait()
+        try:
+            func(index)
+        except:
+            errors.append(sys.exc_info())
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+def test_exactly_once_activation():
+    clear_registry()
+    import threading
+    import time
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+
+    class IWork(ExtensionInterface):
+        pass
+
+    inits = []
+    lock = threading.Lock()
+
+    class SlowWorker(Component):
+        implements(IWork)
+        def __init__(self):
+            lock.acquire()
+            inits.append(self.__class__)
+            lock.release()
+            time.sleep(0.02)
+            self.ready = True
+
+    class QuickWorker(Component):
+        implements(IWork)
+        def __init__(self):
+            lock.acquire()
+            inits.append(self.__class__)
+            lock.release()
+            self.ready = True
+
+    mgr = ComponentManager()
+    seen = [None] * THREADS
+    def work(index):
+        for i in range(50):
+            workers = mgr.get_all(IWork)
+            assert [w.__class__ for w in workers] == [SlowWorker, QuickWorker]
+            assert all(w.ready for w in workers)
+            assert SlowWorker(mgr) is workers[0]
+            if seen[index] is None:
+                seen[index] = workers
+            assert [id(w) for w in workers] == [id(w) for w in seen[index]]
+    hammer(THREADS, work)
+
+    assert sorted(inits) == sorted([SlowWorker, QuickWorker])
+    assert len(set(tuple(id(w) for w in workers) for workers in seen)) == 1
+
+def test_failed_activation_is_retried_once():
+    clear_registry()
+    import threading
+    import time
+    from giblets import Component, ComponentManager
+
+    attempts = []
+    lock = threading.Lock()
+
+    class Flaky(Component):
+        def __init__(self):
+            lock.acquire()
+            attempts.append(1)
+            first = len(attempts) == 1
+            lock.release()
+            time.sleep(0.02)
+            if first:
+                raise IOError('first attempt fails')
+
+    mgr = ComponentManager()
+    results = []
+    def work(index):
+        try:
+            results.append(Flaky(mgr))
+        except IOError:
+            results.append(None)
+    hammer(THREADS, work)
+
+    assert len(attempts) == 2
+    assert results.count(None) == 1
+    instances = set(id(r) for r in results if r is not None)
+    assert len(instances) == 1
+
+def test_shared_and_pooled_components():
+    clear_registry()
+    import threading
+    import time
+    from giblets import Component, ComponentManager
+
+    inits = []
+    lock = threading.Lock()
+
+    class Catalog(Component):
+        shared = True
+        def __init__(self):
+            lock.acquire()
+            inits.append(self)
+            lock.release()
+            time.sleep(0.02)
+
+    class Parser(Component):
+        scope = 'pooled'
+        pool_size = 4
+        def __init__(self):
+            self.in_use = False
+
+    mgr = ComponentManager()
+    catalogs = [None] * THREADS
+    def work(index):
+        # one manager per thread, one Catalog between them
+        catalogs[index] = Catalog(ComponentManager())
+        for i in range(20):
+            with mgr.lease(Parser) as parser:
+                assert not parser.in_use
+                parser.in_use = True
+                time.sleep(0.0005)
+                parser.in_use = False
+    hammer(THREADS, work)
+
+    assert len(inits) == 1
+    assert all(c is inits[0] for c in catalogs)
+
+def test_registration_during_lookups():
+    clear_registry()
+    import threading
+    from giblets import Component, ComponentManager, ExtensionInterface, define_components
+
+    class IGrow(ExtensionInterface):
+        pass
+
+    mgr = ComponentManager()
+    done = threading.Event()
+    seen = []
+    def look(index):
+        while not done.is_set():
+            seen.append([c.__class__ for c in mgr.get_all(IGrow)])
+
+    def grow(index):
+        if index == 0:
+            try:
+                for i in range(100):
+                    # named as they are defined, so a lookup never 
+                    # sees two of them under the same id.
+                    define_components([('Grown%d' % i, (Component,), {}, [IGrow])])
+            finally:
+                done.set()
+        else:
+            look(index)
+    hammer(8, grow)
+
+    # every lookup saw the components in registration order, and
+    # nothing stale was left behind once registration stopped.
+    final = [c.__class__ for c in mgr.get_all(IGrow)]
+    assert len(final) == 100
+    for classes in seen:
+        assert classes == final[:len(classes)]
+
+def test_registration_between_lookup_and_store():
+    clear_registry()
+    import threading
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+    from giblets import core
+
+    class IHeld(ExtensionInterface):
+        pass
+    class Before(Component):
+        implements(IHeld)
+
+    computed = threading.Event()
+    proceed = threading.Event()
+    held = []
+    resolve_order = core._resolve_order
+    def holding_resolve_order(iface, implementors):
+        result = resolve_order(iface, implementors)
+        if iface is IHeld and not held:
+            # hold the first lookup after it has worked out its 
+            # result but before the registry stores it.
+            held.append(result)
+            computed.set()
+            proceed.wait(10)
+        return result
+
+    registry = core.get_registry(core.DEFAULT_REGISTRY)
+    got = []
+    reader = threading.Thread(target=lambda: got.append(registry.implementors(IHeld)))
+    core._resolve_order = holding_resolve_order
+    try:
+        reader.start()
+        assert computed.wait(10)
+        class After(Component):
+            implements(IHeld)
+        proceed.set()
+        reader.join(10)
+    finally:
+        core._resolve_order = resolve_order
+        proceed.set()
+
+    # the held lookup answers for the registry as it was when it 
+    # started, but its result is not kept for later lookups.
+    assert got == [(Before,)]
+    assert registry.implementors(IHeld) == (Before, After)
+    assert [c.__class__ for c in ComponentManager().get_all(IHeld)] == [Before, After]
+
+def test_filtered_lookup_during_indexing():
+    clear_registry()
+    import threading
+    from giblets import Component, ExtensionInterface, implements
+    from giblets import core
+
+    class IBase(ExtensionInterface):
+        pass
+    class IDerived(IBase):
+        pass
+    class Early(Component):
+        implements(IBase)
+
+    reached = threading.Event()
+    proceed = threading.Event()
+    held = []
+    class HoldingRoutes(dict):
+        def setdefault(self, key, default=None):
+            if key is IBase and not held:
+                # hold the indexing of the next IBase implementor
+                held.append(key)
+                reached.set()
+                proceed.wait(10)
+            return dict.setdefault(self, key, default)
+
+    registry = core.get_registry(core.DEFAULT_REGISTRY)
+    registry.routes = HoldingRoutes(registry.routes)
+    def define():
+        class Late(Component):
+            implements(IBase)
+    writer = threading.Thread(target=define)
+    try:
+        writer.start()
+        assert reached.wait(10)
+        # lookups that look at the routes still work part of the way 
+        # through indexing a type.
+        assert registry.implementors(IBase, direct=True) == (Early,)
+        assert registry.implementors(IBase, exclude=IDerived) == (Early,)
+    finally:
+        proceed.set()
+        writer.join(10)
+        registry.routes = dict(registry.routes)
+    assert [c.__name__ for c in registry.implementors(IBase, direct=True)] == ['Early', 'Late']
+
+def test_policy_changes_during_lookups():
+    clear_registry()
+    import threading
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+    from giblets.policy import Blacklist
+
+    class IStep(ExtensionInterface):
+        pass
+    class First(Component):
+        implements(IStep)
+    class Toggled(Component):
+        implements(IStep)
+    class Last(Component):
+        implements(IStep)
+
+    mgr = ComponentManager()
+    policy = Blacklist()
+    mgr.restrict(policy)
+    done = threading.Event()
+    def work(index):
+        if index == 0:
+            try:
+                for i in range(500):
+                    policy.disable_component(Toggled)
+                    policy.enable_component(Toggled)
+                policy.disable_component(Toggled)
+            finally:
+                done.set()
+        elif index == 1:
+            # swapping the policy itself
+            while not done.is_set():
+                mgr.restrict(policy)
+        else:
+            while not done.is_set():
+                steps = [s.__class__ for s in mgr.get_all(IStep)]
+                assert steps in ([First, Toggled, Last], [First, Last])
+    hammer(8, work)
+
+    assert [s.__class__ for s in mgr.get_all(IStep)] == [First, Last]
+    policy.enable_component(Toggled)
+    assert [s.__class__ for s in mgr.get_all(IStep)] == [First, Toggled, Last]
+
+def test_forked_processes():
+    clear_registry()
+    import multiprocessing
+    import os
+    import threading
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+
+    class IWork(ExtensionInterface):
+        pass
+
+    inits = []
+    lock = threading.Lock()
+
+    class Preloaded(Component):
+        implements(IWork)
+        def __init__(self):
+            inits.append(self.__class__.__name__)
+
+    class Lazy(Component):
+        implements(IWork)
+        def __init__(self):
+            lock.acquire()
+            inits.append(self.__class__.__name__)
+            lock.release()
+
+    mgr = ComponentManager()
+    mgr.prepare_for_fork(components=[Preloaded])
+    preloaded = Preloaded(mgr)
+
+    results = multiprocessing.Queue()
+    def child():
+        def work(index):
+            for i in range(20):
+                workers = mgr.get_all(IWork)
+                assert [w.__class__ for w in workers] == [Preloaded, Lazy]
+                assert workers[0] is preloaded
+        try:
+            hammer(8, work)
+            results.put((os.getpid(), sorted(inits)))
+        except Exception, e:
+            results.put((os.getpid(), repr(e)))
+
+    children = [multiprocessing.Process(target=child) for i in range(4)]
+    for process in children:
+        process.start()
+    got = [results.get(timeout=30) for process in children]
+    for process in children:
+        process.join()
+
+    assert len(set(pid for pid, outcome in got)) == 4
+    for pid, outcome in got:
+        assert outcome == ['Lazy', 'Preloaded'], outcome
+    # the parent never activated Lazy
+    assert inits == ['Preloaded']
+
+def test_process_component_from_threads():
+    clear_registry()
+    from giblets import Component, ComponentManager
+
+    class Squarer(Component):
+        scope = 'process'
+        processes = 2
+        def square(self, x):
+            return x * x
+
+    mgr = ComponentManager()
+    try:
+        def work(index):
+            squarer = Squarer(mgr)
+            for i in range(25):
+                assert squarer.square(index * 100 + i) == (index * 100 + i) ** 2
+            assert squarer.batch('square', range(10)) == [x * x for x in range(10)]
+        hammer(8, work)
+    finally:
+        mgr.shutdown()
+
+def test_cross_initialization():
+    clear_registry()
+    import threading
+    from giblets import Component, ComponentManager
+
+    a_started = threading.Event()
+    b_started = threading.Event()
+
+    class Alpha(Component):
+        def __init__(self):
+            a_started.set()
+            b_started.wait()
+            self.beta = Beta(self.compmgr)
+
+    class Beta(Component):
+        def __init__(self):
+            b_started.set()
+            a_started.wait()
+            self.alpha = Alpha(self.compmgr)
+
+    mgr = ComponentManager()
+    got = {}
+    def activate(cls):
+        got[cls] = cls(mgr)
+    threads = [threading.Thread(target=activate, args=(cls,)) for cls in (Alpha, Beta)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive(), 'deadlocked'
+
+    alpha, beta = got[Alpha], got[Beta]
+    assert alpha.beta is beta
+    assert beta.alpha is alpha
+    assert Alpha(mgr) is alpha and Beta(mgr) is beta
@@ -417,3 +417,615 @@ def test_implements_only():
     assert len(machine.widgets) == 2
     assert has_exactly(1, CogWidget, machine.widgets)
     assert has_exactly(1, NoCogWidget, machine.widgets)
+
+
+def test_unregister():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import unregister, get_registry
+
+    class ICog(ExtensionInterface):
+        pass
+
+    class ISpecialCog(ICog):
+        pass
+
+    class Machine(Component):
+        cogs = ExtensionPoint(ICog)
+
+    class Cog(Component):
+        implements(ICog)
+
+    class SpecialCog(Component):
+        implements(ISpecialCog)
+
+    mgr = ComponentManager()
+    machine = Machine(mgr)
+    assert len(machine.cogs) == 2
+    special = SpecialCog(mgr)
+    assert SpecialCog in mgr
+
+    assert unregister(SpecialCog) == [SpecialCog]
+    assert SpecialCog not in get_registry().components
+    assert ISpecialCog not in get_registry().interfaces
+    assert SpecialCog not in mgr
+    assert len(machine.cogs) == 1
+    assert has_exactly(1, Cog, machine.cogs)
+
+    # unregistering again is harmless
+    assert unregister(SpecialCog) == []
+
+    # by module, everything defined here goes
+    removed = unregister(__name__)
+    assert Cog in removed
+    assert Machine in removed
+    assert len(machine.cogs) == 0
+    assert len(get_registry().components) == 0
+
+
+def test_named_registries():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import get_registry, unregister
+
+    class ICog(ExtensionInterface):
+        pass
+
+    class Machine(Component):
+        cogs = ExtensionPoint(ICog)
+
+    class Cog(Component):
+        implements(ICog)
+
+    class WidgetCog(Component):
+        __registry__ = 'widgets'
+        implements(ICog)
+
+    class FancyWidgetCog(WidgetCog):
+        pass
+
+    class GizmoCog(Component):
+        __registry__ = 'gizmos'
+        implements(ICog)
+
+    assert get_registry().components == [Machine, Cog]
+    assert get_registry('widgets').components == [WidgetCog, FancyWidgetCog]
+    assert get_registry('gizmos').implementors(ICog) == (GizmoCog,)
+
+    # by default, only the default registry is used
+    mgr = ComponentManager()
+    machine = Machine(mgr)
+    assert len(machine.cogs) == 1
+    assert has_exactly(1, Cog, machine.cogs)
+
+    widget_mgr = ComponentManager(registries='widgets')
+    assert len(widget_mgr.get_all(ICog)) == 2
+    assert has_exactly(1, FancyWidgetCog, widget_mgr.get_all(ICog))
+
+    both_mgr = ComponentManager(registries=['default', 'gizmos'])
+    machine = Machine(both_mgr)
+    assert len(machine.cogs) == 2
+    assert has_exactly(1, Cog, machine.cogs)
+    assert has_exactly(1, GizmoCog, machine.cogs)
+
+    # unloading one registry's components leaves the others alone
+    unregister(GizmoCog)
+    assert len(machine.cogs) == 1
+    assert len(widget_mgr.get_all(ICog)) == 2
+
+    # an ordinary member named registry has nothing to do with it
+    class Catalog(Component):
+        implements(ICog)
+        registry = ExtensionPoint(ICog)
+    assert has_exactly(1, Catalog, mgr.get_all(ICog))
+
+    try:
+        class Misplaced(Component):
+            __registry__ = ['widgets']
+        assert False, 'registry given by a list'
+    except TypeError, e:
+        assert 'Misplaced' in str(e)
+
+def test_interface_hierarchy_queries():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import get_registry
+
+    class IVehicle(ExtensionInterface):
+        pass
+
+    class IBoat(IVehicle):
+        pass
+
+    class ICar(IVehicle):
+        pass
+
+    class Cart(Component):
+        implements(IVehicle)
+
+    class Canoe(Component):
+        implements(IBoat)
+
+    class Sedan(Component):
+        implements(ICar)
+
+    class AmphibiousCar(Component):
+        implements(ICar, IBoat)
+
+    class Hovercraft(Component):
+        implements(IBoat, IVehicle)
+
+    class Garage(Component):
+        vehicles = ExtensionPoint(IVehicle)
+        landlubbers = ExtensionPoint(IVehicle, exclude=IBoat)
+        plain = ExtensionPoint(IVehicle, direct=True)
+
+    registry = get_registry()
+    assert registry.implementors(IVehicle) == (Cart, Canoe, Sedan, AmphibiousCar, Hovercraft)
+    assert registry.implementors(IVehicle, direct=True) == (Cart, Hovercraft)
+    assert registry.implementors(IVehicle, exclude=IBoat) == (Cart, Sedan, AmphibiousCar, Hovercraft)
+    assert registry.implementors(IVehicle, exclude=(IBoat, ICar)) == (Cart, Hovercraft)
+    assert registry.routes[IVehicle][AmphibiousCar] == set([ICar, IBoat])
+
+    mgr = ComponentManager()
+    garage = Garage(mgr)
+    assert [v.__class__ for v in garage.vehicles] == [Cart, Canoe, Sedan, AmphibiousCar, Hovercraft]
+    assert [v.__class__ for v in garage.landlubbers] == [Cart, Sedan, AmphibiousCar, Hovercraft]
+    assert [v.__class__ for v in garage.plain] == [Cart, Hovercraft]
+    assert [v.__class__ for v in mgr.get_all(IVehicle, exclude=ICar)] == [Cart, Canoe, AmphibiousCar, Hovercraft]
+
+    # the index is kept up to date as components come and go
+    class Rowboat(Component):
+        implements(IBoat)
+
+    assert registry.implementors(IVehicle, exclude=ICar)[-1] == Rowboat
+    from giblets import unregister
+    unregister(Hovercraft)
+    assert registry.implementors(IVehicle, direct=True) == (Cart,)
+    assert Hovercraft not in registry.routes[IBoat]
+
+def test_prepare_for_fork():
+    clear_registry()
+    import os
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+
+    class IHandler(ExtensionInterface):
+        pass
+
+    class Server(Component):
+        handlers = ExtensionPoint(IHandler)
+
+    class FileHandler(Component):
+        implements(IHandler)
+        def __init__(self):
+            self.opened = 1
+        def after_fork(self):
+            self.opened += 1
+
+    class LazyHandler(Component):
+        implements(IHandler)
+        def after_fork(self):
+            raise AssertionError('not active, should not be called')
+
+    class Idle(Component):
+        pass
+
+    mgr = ComponentManager()
+    mgr.prepare_for_fork(components=[Server, FileHandler])
+    assert Server in mgr
+    assert FileHandler in mgr
+    assert LazyHandler not in mgr
+    assert Idle not in mgr
+
+    mgr.after_fork()
+    assert FileHandler(mgr).opened == 2
+
+    import gc
+    threshold = gc.get_threshold()
+    try:
+        mgr.after_fork(gc_threshold=0)
+        assert gc.get_threshold()[0] == 0
+        assert FileHandler(mgr).opened == 3
+        mgr.after_fork(gc_threshold=(50000, 20, 20))
+        assert gc.get_threshold() == (50000, 20, 20)
+    finally:
+        gc.set_threshold(*threshold)
+
+    mgr = ComponentManager()
+    mgr.prepare_for_fork(interfaces=[IHandler])
+    assert FileHandler in mgr
+    assert LazyHandler in mgr
+    assert Server not in mgr
+
+def test_extension_order():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import extension_order, ExtensionError
+
+    class IStage(ExtensionInterface):
+        pass
+
+    class IOther(ExtensionInterface):
+        pass
+
+    class Pipeline(Component):
+        stages = ExtensionPoint(IStage)
+        others = ExtensionPoint(IOther)
+
+    class Render(Component):
+        implements(IStage, IOther)
+        extension_order(IStage, priority=-10)
+
+    class Parse(Component):
+        implements(IStage, IOther)
+        extension_order(IStage, priority=10)
+
+    class Validate(Component):
+        implements(IStage)
+
+    class Normalize(Component):
+        implements(IStage)
+        extension_order(IStage, after=[Parse], before=['tests.test_core.Validate'])
+
+    mgr = ComponentManager()
+    pipeline = Pipeline(mgr)
+    assert [s.__class__ for s in pipeline.stages] == [Parse, Normalize, Validate, Render]
+    # ordering is per interface
+    assert [s.__class__ for s in pipeline.others] == [Render, Parse]
+
+    # disabled components keep the others in order
+    class NoParse(ComponentManager):
+        def is_component_enabled(self, cls):
+            return cls is not Parse
+    assert [s.__class__ for s in Pipeline(NoParse()).stages] == [Normalize, Validate, Render]
+
+    # the same order across several registries
+    class Cache(Component):
+        __registry__ = 'extras'
+        implements(IStage)
+        extension_order(IStage, priority=5, after=[Normalize])
+    mgr = ComponentManager(registries=['default', 'extras'])
+    assert [s.__class__ for s in Pipeline(mgr).stages] == [Parse, Normalize, Cache, Validate, Render]
+
+    class Loop(Component):
+        implements(IStage)
+        extension_order(IStage, before=[Parse], after=[Validate])
+
+    try:
+        Pipeline(mgr).stages
+        assert False, 'expected ExtensionError'
+    except ExtensionError:
+        pass
+
+def test_preload():
+    clear_registry()
+    import threading
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+
+    class IIndex(ExtensionInterface):
+        pass
+
+    started = threading.Event()
+    release = threading.Event()
+    inits = []
+
+    class SlowIndex(Component):
+        implements(IIndex)
+        def __init__(self):
+            inits.append(self)
+            started.set()
+            release.wait()
+            self.ready = True
+
+    class QuickIndex(Component):
+        implements(IIndex)
+        def __init__(self):
+            inits.append(self)
+            self.ready = True
+
+    class BrokenIndex(Component):
+        implements(IIndex)
+        def __init__(self):
+            raise ValueError('broken')
+
+    mgr = ComponentManager()
+    preload = mgr.preload([IIndex])
+    assert started.wait(5)
+    assert not preload.done.is_set()
+    assert preload.progress() == (0, 3)
+
+    # a request for the component being initialized waits for it
+    got = []
+    def request():
+        got.append(SlowIndex(mgr))
+    waiter = threading.Thread(target=request)
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    release.set()
+    waiter.join(5)
+    assert got[0].ready
+
+    assert preload.wait(5)
+    assert preload.progress() == (3, 3)
+    assert [cls for cls, e in preload.failed] == [BrokenIndex]
+    assert len(inits) == 2
+    assert got[0] is SlowIndex(mgr)
+    assert QuickIndex in mgr
+    assert BrokenIndex not in mgr
+
+def test_shared_component():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import unregister
+    from giblets.policy import Blacklist
+
+    class IFormatter(ExtensionInterface):
+        pass
+
+    class Report(Component):
+        formatters = ExtensionPoint(IFormatter)
+
+    inits = []
+
+    class CompiledFormatter(Component):
+        implements(IFormatter)
+        shared = True
+        def __init__(self):
+            inits.append(self)
+
+    class TenantFormatter(Component):
+        implements(IFormatter)
+
+    tenants = [ComponentManager() for i in range(5)]
+    formatters = [Report(mgr).formatters for mgr in tenants]
+    assert len(inits) == 1
+    shared = CompiledFormatter(tenants[0])
+    for mgr, found in zip(tenants, formatters):
+        assert found[0] is shared
+        assert CompiledFormatter in mgr
+    assert len(set(id(found[1]) for found in formatters)) == 5
+
+    # policy is still per manager
+    blacklist = Blacklist()
+    blacklist.disable_component(CompiledFormatter)
+    tenants[1].restrict(blacklist)
+    assert [f.__class__ for f in Report(tenants[1]).formatters] == [TenantFormatter]
+    assert Report(tenants[2]).formatters[0] is shared
+
+    # deactivating in one manager leaves the others alone
+    tenants[2].deactivate(CompiledFormatter)
+    assert CompiledFormatter not in tenants[2]
+    assert Report(tenants[2]).formatters[0] is shared
+    assert len(inits) == 1
+
+    # a replacement class gets its own instance
+    unregister(CompiledFormatter)
+    class CompiledFormatter(Component):
+        implements(IFormatter)
+        shared = True
+        def __init__(self):
+            inits.append(self)
+    assert Report(tenants[3]).formatters[-1] is Report(tenants[4]).formatters[-1]
+    assert len(inits) == 2
+    assert inits[1] is not shared
+
+    # shared components don't hold on to the manager that asked first
+    import gc
+    import weakref
+    mgr = ComponentManager()
+    first = weakref.ref(mgr)
+    formatter = CompiledFormatter(mgr)
+    assert formatter.compmgr is None
+    del mgr
+    gc.collect()
+    assert first() is None
+    assert CompiledFormatter(tenants[0]) is formatter
+
+    # nor can they look up extensions through one manager's policy
+    try:
+        class SharedReport(Component):
+            shared = True
+            formatters = ExtensionPoint(IFormatter)
+        assert False, 'shared component with an ExtensionPoint'
+    except TypeError, e:
+        assert 'formatters' in str(e) and 'SharedReport' in str(e)
+
+def test_pooled_component():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import ExtensionError
+
+    class IParser(ExtensionInterface):
+        pass
+
+    inits = []
+
+    class StreamParser(Component):
+        implements(IParser)
+        scope = 'pooled'
+        pool_size = 2
+        def __init__(self):
+            inits.append(self)
+            self.buffer = []
+        def reset(self):
+            del self.buffer[:]
+
+    class Grammar(Component):
+        implements(IParser)
+
+    class Reader(Component):
+        parsers = ExtensionPoint(IParser)
+
+    mgr = ComponentManager()
+
+    # asking for a pooled component directly is refused, get_all 
+    # leaves it out, as nothing would give it back to the pool.
+    try:
+        StreamParser(mgr)
+        assert False, 'pooled component used without a lease'
+    except ExtensionError, e:
+        assert 'lease' in str(e)
+    assert [p.__class__ for p in mgr.get_all(IParser)] == [Grammar]
+    assert StreamParser not in mgr
+    assert inits == []
+
+    # ExtensionPoints lease pooled implementors, and give them back 
+    # when used in a with block.
+    with Reader(mgr).parsers as parsers:
+        assert [p.__class__ for p in parsers] == [StreamParser, Grammar]
+        leased = parsers[0]
+        leased.buffer.append('data')
+    assert parsers == [] and leased.buffer == []
+    assert len(inits) == 1
+    assert mgr._pools['tests.test_core.StreamParser'].idle == [leased]
+
+    with mgr.lease(IParser) as parsers:
+        assert [p.__class__ for p in parsers] == [StreamParser, Grammar]
+        first = parsers[0]
+        assert first is leased
+        first.buffer.append('data')
+    assert first.buffer == []
+    assert len(inits) == 1
+
+    # released instances are reused without initializing them again
+    with mgr.lease(StreamParser) as parser:
+        assert parser is first
+        with mgr.lease(StreamParser) as other:
+            assert other is not first
+            with mgr.lease(StreamParser) as third:
+                pass
+    assert len(inits) == 3
+    # only pool_size idle instances are kept
+    assert len(mgr._pools['tests.test_core.StreamParser'].idle) == 2
+
+    # singletons are unaffected
+    with mgr.lease(IParser) as parsers:
+        assert parsers[1] is Grammar(mgr)
+
+    # deactivating drops the pool
+    mgr.deactivate(StreamParser)
+    with mgr.lease(StreamParser) as parser:
+        assert parser not in (first, other, third)
+
+def test_call_batch():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+    from giblets import ExtensionError
+
+    class IScorer(ExtensionInterface):
+        pass
+
+    batches = []
+
+    class LengthScorer(Component):
+        implements(IScorer)
+        def score(self, text):
+            return len(text)
+
+    class VectorScorer(Component):
+        implements(IScorer)
+        def score(self, text):
+            raise AssertionError('should be called with the whole batch')
+        def score_batch(self, texts):
+            batches.append(list(texts))
+            return [text.count('a') for text in texts]
+
+    mgr = ComponentManager()
+    columns = mgr.call_batch(IScorer, 'score', iter(['a', 'banana', '']))
+    assert [(c.__class__, r) for c, r in columns] == [(LengthScorer, [1, 6, 0]), 
+                                                      (VectorScorer, [1, 3, 0])]
+    assert batches == [['a', 'banana', '']]
+
+    class BrokenScorer(Component):
+        implements(IScorer)
+        def score_batch(self, texts):
+            return []
+    try:
+        mgr.call_batch(IScorer, 'score', ['a'])
+        assert False, 'expected ExtensionError'
+    except ExtensionError:
+        pass
+
+def test_define_components():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+    from giblets import ExtensionPoint, get_registry
+    from giblets import define_components, deferred_registration
+
+    class IColumn(ExtensionInterface):
+        pass
+
+    class Column(Component):
+        def __init__(self):
+            self.ready = True
+
+    class Table(Component):
+        columns = ExtensionPoint(IColumn)
+
+    mgr = ComponentManager()
+    registry = get_registry()
+    generation = registry.generation
+    columns = define_components([('Column%d' % i, (Column,), {'index': i}, (IColumn,))
+                                 for i in range(5)])
+    assert registry.generation == generation + 1
+    assert [c.__name__ for c in columns] == ['Column%d' % i for i in range(5)]
+    assert columns[0].__module__ == __name__
+    assert [c.index for c in Table(mgr).columns] == range(5)
+    assert all(c.ready for c in Table(mgr).columns)
+
+    with deferred_registration():
+        class Extra(Component):
+            implements(IColumn)
+        with deferred_registration():
+            class Other(Component):
+                implements(IColumn)
+        assert not Other in registry.components
+        assert not mgr.get_all(IColumn)[-1].__class__ in (Extra, Other)
+    assert [c.__class__ for c in mgr.get_all(IColumn)][-2:] == [Extra, Other]
+
+    # nothing is registered from a block that raises
+    try:
+        define_components([('Fine', (Component,), {}, [IColumn]),
+                           ('Broken', (Column, Column), {})])
+        assert False, 'duplicate base class'
+    except TypeError:
+        pass
+    with deferred_registration():
+        class Kept(Component):
+            implements(IColumn)
+        try:
+            with deferred_registration():
+                class Dropped(Component):
+                    implements(IColumn)
+                raise ValueError
+        except ValueError:
+            pass
+    assert [c.__class__.__name__ for c in mgr.get_all(IColumn)][-3:] == ['Extra', 'Other', 'Kept']
+
+def test_implements_before_first_component():
+    # in a fresh interpreter, so that no Component has been defined yet.
+    import os
+    import subprocess
+    import sys
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = '''
+from giblets import ExtensionInterface, implements, implemented_by, Component, ComponentManager
+
+class IAdapter(ExtensionInterface):
+    pass
+
+class PlainAdapter(object):
+    implements(IAdapter)
+
+class AdapterComponent(Component):
+    implements(IAdapter)
+
+assert implemented_by(PlainAdapter) == [IAdapter]
+assert [a.__class__ for a in ComponentManager().get_all(IAdapter)] == [AdapterComponent]
+'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = here
+    proc = subprocess.Popen([sys.executable, '-c', script], stderr=subprocess.PIPE, env=env)
+    out, err = proc.communicate()
+    assert proc.returncode == 0, err
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+
+# modules that are only needed by optional features, which 
+# 'import giblets' should not pay for.
+DEFERRED_MODULES = ['collections', 'contextlib', 'fnmatch', 'functools', 'glob', 
+                    'imp', 'json', 'multiprocessing', 'pickle', 'pkg_resources', 
+                    'subprocess', 'threading', 'zipfile']
+
+def test_import_is_lean():
+    import os
+    import subprocess
+    import sys
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import sys; before = set(sys.modules); "
+              "import giblets, giblets.policy; "
+              "print(' '.join(m for m in sys.modules "
+              "if sys.modules[m] is not None and m not in before))")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = here
+    proc = subprocess.Popen([sys.executable, '-c', script], 
+                            stdout=subprocess.PIPE, env=env)
+    out, err = proc.communicate()
+    assert proc.returncode == 0
+    loaded = set(out.split())
+    assert 'giblets.core' in loaded
+    for module in DEFERRED_MODULES:
+        assert module not in loaded, '%s imported by giblets' % module
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+from helpers import *
+
+def test_memoize():
+    clear_registry()
+    import time
+    from giblets import Component, ComponentManager
+    from giblets.memo import memoize
+
+    calls = []
+
+    class Schema(Component):
+        @memoize(maxsize=2)
+        def lookup(self, name, version=1):
+            calls.append((name, version))
+            return '%s-%d' % (name, version)
+
+        @memoize
+        def everything(self):
+            calls.append('everything')
+            return ['a', 'b']
+
+        @memoize(ttl=0.05)
+        def fresh(self, name):
+            calls.append(('fresh', name))
+            return name
+
+        @memoize(maxsize=None)
+        def unbounded(self, n):
+            return n * 2
+
+    mgr = ComponentManager()
+    schema = Schema(mgr)
+    assert schema.lookup('user') == 'user-1'
+    assert schema.lookup('user') == 'user-1'
+    assert schema.lookup('user', version=2) == 'user-2'
+    assert calls == [('user', 1), ('user', 2)]
+    assert schema.lookup.cache_info() == (1, 2, 2, 2)
+
+    # least recently used goes first
+    schema.lookup('user')
+    schema.lookup('group')
+    assert schema.lookup.cache_info().currsize == 2
+    del calls[:]
+    schema.lookup('user')
+    schema.lookup('user', version=2)
+    assert calls == [('user', 2)]
+
+    assert schema.everything() is schema.everything()
+    assert calls.count('everything') == 1
+
+    # no limit with maxsize None
+    for n in range(200):
+        schema.unbounded(n)
+    assert schema.unbounded.cache_info() == (0, 200, None, 200)
+
+    # unhashable arguments are passed through
+    del calls[:]
+    schema.lookup(['x'])
+    schema.lookup(['x'])
+    assert len(calls) == 2
+
+    schema.fresh('x')
+    schema.fresh('x')
+    time.sleep(0.1)
+    schema.fresh('x')
+    assert calls.count(('fresh', 'x')) == 2
+
+    # each instance has its own cache
+    other = Schema(ComponentManager())
+    assert other.lookup.cache_info().currsize == 0
+
+    schema.lookup.cache_clear()
+    assert schema.lookup.cache_info() == (0, 0, 2, 0)
+
+    # deactivation throws the results away
+    schema.lookup('user')
+    assert schema.lookup.cache_info().currsize == 1
+    mgr.deactivate(Schema)
+    assert schema.lookup.cache_info().currsize == 0
+
+def test_memo_cleared_on_restrict_and_release():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets.memo import memoize
+    from giblets.policy import Blacklist
+
+    class IRule(ExtensionInterface):
+        pass
+
+    class Lower(Component):
+        implements(IRule)
+
+    class Upper(Component):
+        implements(IRule)
+
+    class Rules(Component):
+        rules = ExtensionPoint(IRule)
+        @memoize
+        def names(self):
+            return [r.__class__.__name__ for r in self.rules]
+
+    class Scratch(Component):
+        scope = 'pooled'
+        @memoize
+        def stamp(self, x):
+            return object()
+
+    mgr = ComponentManager()
+    rules = Rules(mgr)
+    assert rules.names() == ['Lower', 'Upper']
+
+    # results may depend on the policy, so a new one clears them
+    blacklist = Blacklist()
+    blacklist.disable_component(Upper)
+    mgr.restrict(blacklist)
+    assert rules.names() == ['Lower']
+
+    with mgr.lease(Scratch) as scratch:
+        first = scratch.stamp(1)
+        assert scratch.stamp(1) is first
+    with mgr.lease(Scratch) as again:
+        assert again is scratch
+        assert again.stamp.cache_info().currsize == 0
+        assert again.stamp(1) is not first
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+from helpers import *
+
+def test_native_declarations():
+    from giblets import native_backend as native
+
+    class IBase(native.Interface):
+        pass
+    class IPart(IBase):
+        size = native.Attribute("how big the part is")
+    class IBall(IBase):
+        pass
+
+    assert IPart.__iro__ == (IPart, IBase, native.Interface)
+    assert IPart.extends(IBase)
+    assert not IPart.extends(IPart)
+    assert IPart.isOrExtends(IPart)
+    assert IPart.size.__doc__ == "how big the part is"
+
+    class Part(object):
+        native.implements(IPart)
+    class EyeBall(Part):
+        native.implements(IBall)
+    class Marble(EyeBall):
+        native.implements_only(IBall)
+
+    assert native.declared_interfaces(Part) == (IPart,)
+    assert native.declared_interfaces(EyeBall) == (IBall, IPart)
+    assert native.declared_interfaces(Marble) == (IBall,)
+    assert native.class_iro(EyeBall) == (IBall, IPart, IBase, native.Interface)
+    assert native.object_iro(EyeBall()) == native.class_iro(EyeBall)
+    assert IBase.implementedBy(EyeBall)
+    assert not IPart.providedBy(Marble())
+
+    try:
+        native.implements(IBall)
+        assert False, 'implements outside a class definition'
+    except TypeError:
+        pass
+
+    try:
+        class Twice(object):
+            native.implements(IBall)
+            native.implements(IPart)
+        assert False, 'implements used twice'
+    except TypeError:
+        pass
+
+    try:
+        class NotAnInterface(object):
+            native.implements(Part)
+        assert False, 'implements a class'
+    except TypeError:
+        pass
+
+def test_native_backend_skips_zope():
+    import os
+    import subprocess
+    import sys
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import sys\n"
+              "from giblets import *\n"
+              "class IThing(ExtensionInterface): pass\n"
+              "class Thing(Component): implements(IThing)\n"
+              "class Things(Component):\n"
+              "    things = ExtensionPoint(IThing)\n"
+              "mgr = ComponentManager()\n"
+              "assert [t.__class__ for t in Things(mgr).things] == [Thing]\n"
+              "assert implemented_by(Thing) == [IThing]\n"
+              "print(' '.join(m for m in sys.modules if m.startswith('zope.interface')))\n")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = here
+    env['GIBLETS_INTERFACE_BACKEND'] = 'native'
+    proc = subprocess.Popen([sys.executable, '-c', script],
+                            stdout=subprocess.PIPE, env=env)
+    out, err = proc.communicate()
+    assert proc.returncode == 0
+    assert out.strip() == ''
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+from helpers import *
+
+PLAN_PLUGIN_SOURCE = """
+from giblets import Component, ExtensionInterface, implements, extension_order
+
+class ITool(ExtensionInterface):
+    pass
+
+class Hammer(Component):
+    implements(ITool)
+
+class Saw(Component):
+    implements(ITool)
+    extension_order(ITool, priority=1)
+
+class Drill(Component):
+    implements(ITool)
+"""
+
+def test_save_and_load_plan():
+    clear_registry()
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets import ComponentManager
+    from giblets.policy import Blacklist
+    from giblets.plan import save_plan, load_plan
+
+    plan_dir = tempfile.mkdtemp()
+    plugin_file = os.path.join(plan_dir, 'giblets_plan_test_plugin.py')
+    plan_file = os.path.join(plan_dir, 'plan.json')
+    f = open(plugin_file, 'w')
+    f.write(PLAN_PLUGIN_SOURCE)
+    f.close()
+    sys.path.insert(0, plan_dir)
+    try:
+        import giblets_plan_test_plugin as plugin
+        
+        mgr = ComponentManager()
+        blacklist = Blacklist()
+        blacklist.disable_component(plugin.Drill)
+        mgr.restrict(blacklist)
+        save_plan(mgr, plan_file, [plugin.ITool], version='1.0')
+
+        # a fresh manager with no policy follows the plan
+        mgr = ComponentManager()
+        assert not load_plan(mgr, plan_file, version='2.0')
+        assert load_plan(mgr, plan_file, version='1.0')
+        assert [t.__class__ for t in mgr.get_all(plugin.ITool)] == [plugin.Saw, plugin.Hammer]
+
+        # changes to the registry end the plan
+        from giblets import unregister
+        unregister(plugin.Hammer)
+        assert [t.__class__ for t in mgr.get_all(plugin.ITool)] == [plugin.Saw, plugin.Drill]
+
+        # changes to the source invalidate it
+        mgr = ComponentManager()
+        os.utime(plugin_file, (1000000000, 1000000000))
+        assert not load_plan(mgr, plan_file, version='1.0')
+        assert len(mgr.get_all(plugin.ITool)) == 2
+
+        assert not load_plan(mgr, os.path.join(plan_dir, 'missing.json'))
+    finally:
+        sys.path.remove(plan_dir)
+        sys.modules.pop('giblets_plan_test_plugin', None)
+        shutil.rmtree(plan_dir)
+
+def test_plan_of_path_plugins():
+    clear_registry()
+    import json
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets import ComponentManager, unregister
+    from giblets.policy import Blacklist
+    from giblets.plan import save_plan, load_plan
+    from giblets.search import find_plugins_in_path
+
+    plan_dir = tempfile.mkdtemp()
+    plugin_dir = os.path.join(plan_dir, 'plugins')
+    os.mkdir(plugin_dir)
+    f = open(os.path.join(plugin_dir, 'giblets_plan_path_plugin.py'), 'w')
+    f.write(PLAN_PLUGIN_SOURCE)
+    f.close()
+    plan_file = os.path.join(plan_dir, 'plan.json')
+    cwd = os.getcwd()
+    try:
+        # found through a relative path, not importable by name
+        os.chdir(plan_dir)
+        try:
+            find_plugins_in_path('plugins')
+        finally:
+            os.chdir(cwd)
+        plugin = sys.modules['giblets_plan_path_plugin']
+        save_plan(ComponentManager(), plan_file, [plugin.ITool])
+        plan = json.load(open(plan_file))
+        for state in plan['sources'].values():
+            assert state is None or os.path.isabs(state[0])
+
+        # as in a new process
+        unregister(plugin)
+        del sys.modules['giblets_plan_path_plugin']
+        mgr = ComponentManager()
+        assert load_plan(mgr, plan_file)
+        plugin = sys.modules['giblets_plan_path_plugin']
+        assert [t.__class__ for t in mgr.get_all(plugin.ITool)] == \
+               [plugin.Saw, plugin.Hammer, plugin.Drill]
+
+        # a new policy replaces the plan
+        blacklist = Blacklist()
+        blacklist.disable_component(plugin.Saw)
+        mgr.restrict(blacklist)
+        assert [t.__class__ for t in mgr.get_all(plugin.ITool)] == \
+               [plugin.Hammer, plugin.Drill]
+    finally:
+        unregister('giblets_plan_path_plugin')
+        sys.modules.pop('giblets_plan_path_plugin', None)
+        shutil.rmtree(plan_dir)
@@ -133,3 +133,84 @@ def test_patterns():
     policy.patterns.insert(0, pat)
     assert has_exactly(0, GoodCog, widget.cogs)
     assert has_exactly(0, BadCog, widget.cogs)
+
+
+def test_chain():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets.policy import Blacklist, Whitelist, Patterns, Chain
+
+    class ICog(ExtensionInterface):
+        pass
+
+    class Widget(Component):
+        cogs = ExtensionPoint(ICog)
+
+    class GoodCog(Component):
+        implements(ICog)
+
+    class BadCog(Component):
+        implements(ICog)
+
+    class SpareCog(Component):
+        implements(ICog)
+
+    tenant = Whitelist()
+    blacklist = Blacklist()
+    defaults = Patterns()
+    defaults.append_pattern('*.GoodCog', enable=True)
+
+    # tenant whitelist, then global blacklist, then pattern defaults.
+    policy = Chain([tenant, blacklist, defaults])
+    mgr = ComponentManager()
+    mgr.restrict(policy)
+    widget = Widget(mgr)
+
+    def cogs():
+        return [cog.__class__.__name__ for cog in widget.cogs]
+
+    policy.compile()
+    assert cogs() == ['GoodCog']
+
+    tenant.enable_component(SpareCog)
+    assert cogs() == ['GoodCog', 'SpareCog']
+
+    blacklist.disable_component(GoodCog)
+    assert cogs() == ['SpareCog']
+
+    # the whitelist comes first
+    tenant.enable_component(GoodCog)
+    assert cogs() == ['GoodCog', 'SpareCog']
+
+    # the patterns list is changed in place
+    defaults.patterns.insert(0, defaults.build_pattern('*.BadCog', True))
+    assert cogs() == ['GoodCog', 'BadCog', 'SpareCog']
+
+    # no opinion falls back to the default
+    policy = Chain([Blacklist()], default=True)
+    mgr.restrict(policy)
+    assert cogs() == ['GoodCog', 'BadCog', 'SpareCog']
+
+    # all-of and any-of
+    whitelist = Whitelist()
+    whitelist.enable_component(GoodCog)
+    whitelist.enable_component(BadCog)
+    blacklist = Blacklist()
+    blacklist.disable_component(BadCog)
+    mgr.restrict(Chain([whitelist, blacklist], mode='all'))
+    assert cogs() == ['GoodCog']
+    mgr.restrict(Chain([whitelist, blacklist], mode='any'))
+    assert cogs() == ['GoodCog', 'BadCog', 'SpareCog']
+    mgr.restrict(Chain([whitelist, Whitelist()], mode='any'))
+    assert cogs() == ['GoodCog', 'BadCog']
+
+    # policies without revisions are consulted every time
+    class Toggle(object):
+        enabled = False
+        def is_component_enabled(self, component):
+            return self.enabled
+    toggle = Toggle()
+    mgr.restrict(Chain([Blacklist(), toggle]))
+    assert cogs() == []
+    toggle.enabled = True
+    assert cogs() == ['GoodCog', 'BadCog', 'SpareCog']
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+
+from giblets import ExtensionInterface
+
+class IPreflightTest(ExtensionInterface):
+    pass
+
+PLUGINS = {
+    'giblets_preflight_good': """
+from giblets import Component, implements
+from tests.test_preflight import IPreflightTest
+print 'noisy plugins do not confuse the check'
+class GoodPlugin(Component):
+    implements(IPreflightTest)
+""",
+    'giblets_preflight_broken': """
+from giblets import Component, implements
+from tests.test_preflight import IPreflightTest
+class HalfPlugin(Component):
+    implements(IPreflightTest)
+raise ValueError('broken plugin')
+""",
+    'giblets_preflight_chatty': """
+import os
+import __main__
+from giblets import Component, implements
+from tests.test_preflight import IPreflightTest
+# far more than a pipe holds, straight to the real stdout, but only 
+# in the preflight helper so as not to fill the test output.
+if os.path.basename(getattr(__main__, '__file__', '')).startswith('preflight.py'):
+    os.write(1, ('chatter ' * 16 + '\\n') * 4096)
+class ChattyPlugin(Component):
+    implements(IPreflightTest)
+""",
+    'giblets_preflight_slow': """
+import time
+time.sleep(30)
+""",
+}
+
+BATCH_PLUGINS = {
+    'giblets_preflight_batch': """
+from giblets import Component, define_components
+from tests.test_preflight import IPreflightTest
+define_components([('BatchPlugin%d' % i, (Component,), {}, [IPreflightTest])
+                   for i in range(2)])
+""",
+    'giblets_preflight_batch_broken': """
+from giblets import Component, define_components
+from tests.test_preflight import IPreflightTest
+define_components([('HalfBatchPlugin', (Component,), {}, [IPreflightTest])])
+raise ValueError('broken plugin')
+""",
+}
+
+def write_plugins(plugin_dir, plugins=PLUGINS):
+    import os
+    for module_name, source in plugins.items():
+        f = open(os.path.join(plugin_dir, module_name + '.py'), 'w')
+        f.write(source)
+        f.close()
+
+def forget_plugins(plugins=PLUGINS):
+    import sys
+    from giblets import unregister
+    for module_name in plugins:
+        unregister(module_name)
+        sys.modules.pop(module_name, None)
+
+def test_failed_load_is_unregistered():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets import ComponentManager
+    from giblets.search import find_plugins_in_path
+
+    plugin_dir = tempfile.mkdtemp()
+    try:
+        f = open(os.path.join(plugin_dir, 'giblets_preflight_broken.py'), 'w')
+        f.write(PLUGINS['giblets_preflight_broken'])
+        f.close()
+        find_plugins_in_path(plugin_dir)
+        assert ComponentManager().get_all(IPreflightTest) == []
+    finally:
+        forget_plugins()
+        shutil.rmtree(plugin_dir)
+
+def test_preflight_path():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    import time
+    from giblets import ComponentManager
+    from giblets.preflight import Preflight
+    from giblets.search import find_plugins_in_path
+
+    plugin_dir = tempfile.mkdtemp()
+    cache = os.path.join(plugin_dir, 'preflight.json')
+    try:
+        write_plugins(plugin_dir)
+        preflight = Preflight(timeout=2, cache=cache)
+        started = time.time()
+        find_plugins_in_path(plugin_dir, preflight=preflight)
+        assert time.time() - started < 20
+
+        found = ComponentManager().get_all(IPreflightTest)
+        assert [p.__class__.__name__ for p in found] == ['ChattyPlugin', 'GoodPlugin']
+        assert not 'giblets_preflight_broken' in sys.modules
+        assert not 'giblets_preflight_slow' in sys.modules
+
+        results = dict((os.path.basename(path), result)
+                       for path, result in preflight.results.items())
+        good = results['giblets_preflight_good.py']
+        assert good.ok and good.error is None
+        assert good.components == ['giblets_preflight_good.GoodPlugin']
+        chatty = results['giblets_preflight_chatty.py']
+        assert chatty.ok and chatty.components == ['giblets_preflight_chatty.ChattyPlugin']
+        assert not results['giblets_preflight_broken.py'].ok
+        assert 'broken plugin' in results['giblets_preflight_broken.py'].error
+        assert not results['giblets_preflight_slow.py'].ok
+        assert 'timed out' in results['giblets_preflight_slow.py'].error
+
+        # unchanged files are not checked again
+        forget_plugins()
+        preflight = Preflight(timeout=2, cache=cache)
+        started = time.time()
+        find_plugins_in_path(plugin_dir, preflight=preflight)
+        assert time.time() - started < 1
+        found = ComponentManager().get_all(IPreflightTest)
+        assert [p.__class__.__name__ for p in found] == ['ChattyPlugin', 'GoodPlugin']
+    finally:
+        forget_plugins()
+        shutil.rmtree(plugin_dir)
+
+def test_batch_registered_plugins():
+    import os
+    import shutil
+    import tempfile
+    from giblets import ComponentManager
+    from giblets.preflight import Preflight
+    from giblets.search import find_plugins_in_path
+
+    plugin_dir = tempfile.mkdtemp()
+    try:
+        write_plugins(plugin_dir, BATCH_PLUGINS)
+        # Components registered in a batch are rolled back too
+        find_plugins_in_path(plugin_dir)
+        found = ComponentManager().get_all(IPreflightTest)
+        assert [p.__class__.__name__ for p in found] == ['BatchPlugin0', 'BatchPlugin1']
+
+        forget_plugins(BATCH_PLUGINS)
+        preflight = Preflight(timeout=10)
+        find_plugins_in_path(plugin_dir, preflight=preflight)
+        results = dict((os.path.basename(path), result)
+                       for path, result in preflight.results.items())
+        assert results['giblets_preflight_batch.py'].components == \
+            ['giblets_preflight_batch.BatchPlugin0', 'giblets_preflight_batch.BatchPlugin1']
+        assert not results['giblets_preflight_batch_broken.py'].ok
+        found = ComponentManager().get_all(IPreflightTest)
+        assert [p.__class__.__name__ for p in found] == ['BatchPlugin0', 'BatchPlugin1']
+    finally:
+        forget_plugins(BATCH_PLUGINS)
+        shutil.rmtree(plugin_dir)
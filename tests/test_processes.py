@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+from helpers import *
+
+def test_process_component():
+    clear_registry()
+    import os
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets import ExtensionError
+
+    class IScorer(ExtensionInterface):
+        pass
+
+    class Ranker(Component):
+        scorers = ExtensionPoint(IScorer)
+
+    class HeavyScorer(Component):
+        implements(IScorer)
+        scope = 'process'
+        processes = 2
+        def __init__(self):
+            self.calls = 0
+        def score(self, x, power=2):
+            self.calls += 1
+            return x ** power
+        def pid(self):
+            return os.getpid()
+        def fail(self):
+            raise ValueError('no good')
+        def crash(self):
+            os._exit(1)
+
+    class LightScorer(Component):
+        implements(IScorer)
+        def score(self, x, power=2):
+            return x
+
+    mgr = ComponentManager()
+    try:
+        scorers = Ranker(mgr).scorers
+        assert [s.score(3) for s in scorers] == [9, 3]
+        heavy = scorers[0]
+        assert heavy is HeavyScorer(mgr)
+        assert heavy.score(2, power=3) == 8
+
+        # calls are spread over the workers
+        pids = set(heavy.pid() for i in range(4))
+        assert len(pids) == 2
+        assert os.getpid() not in pids
+
+        assert heavy.batch('score', range(10)) == [x ** 2 for x in range(10)]
+
+        # a batch that fails part of the way leaves no replies behind
+        try:
+            heavy.batch('score', [3, lambda x: x])
+            assert False, 'expected a pickling error'
+        except Exception, e:
+            assert not isinstance(e, AssertionError)
+        assert [heavy.score(x) for x in range(4)] == [0, 1, 4, 9]
+        assert heavy.batch('score', [5, 6]) == [25, 36]
+
+        try:
+            heavy.fail()
+            assert False, 'expected ValueError'
+        except ValueError:
+            pass
+
+        # crashed workers are restarted
+        try:
+            heavy.crash()
+            assert False, 'expected ExtensionError'
+        except ExtensionError:
+            pass
+        new_pids = set(heavy.pid() for i in range(4))
+        assert len(new_pids) == 2
+        assert new_pids != pids
+    finally:
+        mgr.shutdown()
+
+def test_process_component_call_batch():
+    clear_registry()
+    from giblets import Component, ComponentManager, ExtensionInterface, implements
+
+    class IScorer(ExtensionInterface):
+        pass
+
+    class SquareScorer(Component):
+        implements(IScorer)
+        scope = 'process'
+        def score(self, x):
+            return x * x
+
+    class BatchScorer(Component):
+        implements(IScorer)
+        scope = 'process'
+        processes = 2
+        def score(self, x):
+            raise ValueError('called one at a time')
+        def score_batch(self, xs):
+            import os
+            return [(x + 1, os.getpid()) for x in xs]
+
+    mgr = ComponentManager()
+    try:
+        [(proxy, results), (batching, batched)] = mgr.call_batch(IScorer, 'score', range(5))
+        assert results == [0, 1, 4, 9, 16]
+        # a batch method is used, once in each worker
+        assert [r for r, pid in batched] == [1, 2, 3, 4, 5]
+        assert len(set(pid for r, pid in batched)) == 2
+    finally:
+        mgr.shutdown()
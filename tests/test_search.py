@@ -68,4 +68,493 @@ def test_load_from_entry_point():
         got_plugins.add(plugin_name)
     for plugin_name in expected_plugins:
         assert plugin_name in got_plugins
-    
\ No newline at end of file
+    
+class TestReloadInterface(ExtensionInterface):
+    pass
+
+RELOAD_PLUGIN_SOURCE = """
+from giblets.core import Component, implements
+from tests.test_search import TestReloadInterface
+
+class ReloadPluginA(Component):
+    implements(TestReloadInterface)
+    version = %d
+
+class ReloadPluginB(Component):
+    implements(TestReloadInterface)
+    version = %d
+"""
+
+def test_reload_from_path():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets.core import ComponentManager, Component, ExtensionPoint
+    from giblets.search import find_plugins_in_path
+
+    class PluginFinder(Component):
+        found_plugins = ExtensionPoint(TestReloadInterface)
+
+    def write_plugin(path, version, mtime):
+        f = open(path, 'w')
+        f.write(RELOAD_PLUGIN_SOURCE % (version, version))
+        f.close()
+        os.utime(path, (mtime, mtime))
+
+    plugin_dir = tempfile.mkdtemp()
+    plugin_file = os.path.join(plugin_dir, 'giblets_reload_test_plugin.py')
+    try:
+        write_plugin(plugin_file, 1, 1000000000)
+        find_plugins_in_path(plugin_dir)
+
+        mgr = ComponentManager()
+        pf = PluginFinder(mgr)
+        first = pf.found_plugins
+        assert [p.__class__.__name__ for p in first] == ['ReloadPluginA', 'ReloadPluginB']
+        assert [p.version for p in first] == [1, 1]
+
+        # unchanged files are not executed again
+        find_plugins_in_path(plugin_dir, reload=True)
+        assert [id(p) for p in pf.found_plugins] == [id(p) for p in first]
+
+        # without reload, changes are ignored
+        write_plugin(plugin_file, 2, 1000000010)
+        find_plugins_in_path(plugin_dir)
+        assert [p.version for p in pf.found_plugins] == [1, 1]
+
+        # with reload, the new classes take the place of the old ones
+        find_plugins_in_path(plugin_dir, reload=True)
+        second = pf.found_plugins
+        assert [p.__class__.__name__ for p in second] == ['ReloadPluginA', 'ReloadPluginB']
+        assert [p.version for p in second] == [2, 2]
+        for old, new in zip(first, second):
+            assert old.__class__ is not new.__class__
+            assert old not in mgr.components.values()
+    finally:
+        sys.modules.pop('giblets_reload_test_plugin', None)
+        shutil.rmtree(plugin_dir)
+
+def test_failed_reload_from_path():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets.core import ComponentManager, unregister
+    from giblets.search import iter_plugins_in_path
+
+    def write_plugin(path, source, mtime):
+        f = open(path, 'w')
+        f.write(source)
+        f.close()
+        os.utime(path, (mtime, mtime))
+
+    def found():
+        return [(p.__class__.__name__, p.version)
+                for p in ComponentManager().get_all(TestReloadInterface)
+                if p.__module__ == 'giblets_failed_reload_test_plugin']
+
+    plugin_dir = tempfile.mkdtemp()
+    plugin_file = os.path.join(plugin_dir, 'giblets_failed_reload_test_plugin.py')
+    try:
+        write_plugin(plugin_file, RELOAD_PLUGIN_SOURCE % (1, 1), 1000000000)
+        list(iter_plugins_in_path(plugin_dir))
+        assert found() == [('ReloadPluginA', 1), ('ReloadPluginB', 1)]
+
+        # a syntax error keeps the components loaded before
+        write_plugin(plugin_file, 'class (:\n', 1000000010)
+        discoveries = list(iter_plugins_in_path(plugin_dir, reload=True))
+        assert len(discoveries) == 1 and 'SyntaxError' in discoveries[0].error
+        assert found() == [('ReloadPluginA', 1), ('ReloadPluginB', 1)]
+
+        # as does an error part of the way through the module
+        write_plugin(plugin_file, RELOAD_PLUGIN_SOURCE % (2, 2) + 'raise ValueError\n',
+                     1000000020)
+        discoveries = list(iter_plugins_in_path(plugin_dir, reload=True))
+        assert len(discoveries) == 1 and 'ValueError' in discoveries[0].error
+        assert found() == [('ReloadPluginA', 1), ('ReloadPluginB', 1)]
+        assert 'giblets_failed_reload_test_plugin' in sys.modules
+
+        # once it is fixed, the new components take over
+        write_plugin(plugin_file, RELOAD_PLUGIN_SOURCE % (3, 3), 1000000030)
+        list(iter_plugins_in_path(plugin_dir, reload=True))
+        assert found() == [('ReloadPluginA', 3), ('ReloadPluginB', 3)]
+    finally:
+        unregister('giblets_failed_reload_test_plugin')
+        sys.modules.pop('giblets_failed_reload_test_plugin', None)
+        shutil.rmtree(plugin_dir)
+
+class TestEntryFailureInterface(ExtensionInterface):
+    pass
+
+class FakeDistribution(object):
+    location = '/nowhere'
+
+    def __init__(self, project_name, version='1.0', requires=()):
+        self.project_name = project_name
+        self.key = project_name.lower()
+        self.version = version
+        self._requires = list(requires)
+
+    def requires(self, extras=()):
+        return self._requires
+
+class FakeEntryPoint(object):
+    """
+    stands in for a pkg_resources EntryPoint whose module defines 
+    Components when it is imported.
+    """
+    extras = ()
+
+    def __init__(self, name, fail=False, missing=False):
+        self.name = name
+        self.fail = fail
+        requires = ['missing'] if missing else ['base']
+        self.dist = FakeDistribution('plugin-%s' % name, requires=requires)
+
+    def resolve(self):
+        from giblets.core import Component, implements
+        class Plugin(Component):
+            implements(TestEntryFailureInterface)
+            name = self.name
+        Plugin.__name__ = 'EntryFailurePlugin_%s' % self.name
+        if self.fail:
+            raise ImportError('broken plugin')
+
+class FakeWorkingSet(object):
+    """
+    a working set holding the entries' distributions and 'base', 
+    which is all any of them may require.
+    """
+    def __init__(self, entries, base_version='1.0'):
+        self.entries = entries
+        self.by_key = {'base': FakeDistribution('base', base_version)}
+        for entry in entries:
+            self.by_key[entry.dist.key] = entry.dist
+        self.resolutions = 0
+
+    def __iter__(self):
+        return iter(self.by_key.values())
+
+    def iter_entry_points(self, group):
+        return iter(self.entries)
+
+    def resolve(self, requirements, env=None, installer=None, extras=None):
+        self.resolutions += 1
+        for requirement in requirements:
+            if requirement not in self.by_key:
+                raise ImportError('%s not found' % requirement)
+        return [self.by_key[requirement] for requirement in requirements]
+
+    def add(self, dist):
+        pass
+
+def test_load_from_entry_point_failures():
+    from giblets.core import ComponentManager
+    from giblets.search import find_plugins_by_entry_point
+
+    ws = FakeWorkingSet([FakeEntryPoint('first'), 
+                         FakeEntryPoint('broken', fail=True),
+                         FakeEntryPoint('unresolved', missing=True),
+                         FakeEntryPoint('last')])
+    find_plugins_by_entry_point('giblets_entry_failure_test', ws)
+    plugins = ComponentManager().get_all(TestEntryFailureInterface)
+    assert [p.name for p in plugins] == ['first', 'last']
+
+def test_resolution_cache():
+    import os
+    import shutil
+    import tempfile
+    from giblets.search import find_plugins_by_entry_point
+
+    class NoopEntryPoint(FakeEntryPoint):
+        def resolve(self):
+            pass
+
+    cache_dir = tempfile.mkdtemp()
+    cache = os.path.join(cache_dir, 'resolved.json')
+    try:
+        # each distribution is resolved once per call
+        entries = [NoopEntryPoint('one'), NoopEntryPoint('one'), NoopEntryPoint('two')]
+        ws = FakeWorkingSet(entries)
+        find_plugins_by_entry_point('giblets_cache_test', ws, resolution_cache=cache)
+        assert ws.resolutions == 2
+        assert os.path.exists(cache)
+
+        # and not at all while the working set is unchanged
+        ws = FakeWorkingSet(entries)
+        find_plugins_by_entry_point('giblets_cache_test', ws, resolution_cache=cache)
+        assert ws.resolutions == 0
+
+        # a different version of anything in the working set means 
+        # resolving everything again
+        ws = FakeWorkingSet(entries, base_version='2.0')
+        find_plugins_by_entry_point('giblets_cache_test', ws, resolution_cache=cache)
+        assert ws.resolutions == 2
+        ws = FakeWorkingSet(entries, base_version='2.0')
+        find_plugins_by_entry_point('giblets_cache_test', ws, resolution_cache=cache)
+        assert ws.resolutions == 0
+    finally:
+        shutil.rmtree(cache_dir)
+
+class TestTreeInterface(ExtensionInterface):
+    pass
+
+TREE_PLUGIN_SOURCE = """
+from giblets.core import Component, implements
+from tests.test_search import TestTreeInterface
+
+class %s(Component):
+    implements(TestTreeInterface)
+"""
+
+def test_load_from_tree():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets.core import ComponentManager, unregister
+    from giblets import search
+
+    root = tempfile.mkdtemp()
+    def write(relpath, source):
+        path = os.path.join(root, *relpath.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'w')
+        f.write(source)
+        f.close()
+
+    def found():
+        return sorted('%s.%s' % (p.__class__.__module__, p.__class__.__name__)
+                      for p in ComponentManager().get_all(TestTreeInterface))
+
+    write('top.py', TREE_PLUGIN_SOURCE % 'Top')
+    write('tools/__init__.py', 'SIZE = 3\n')
+    write('tools/brush.py', 'from giblets_tree_test.tools import SIZE\n' + 
+                            TREE_PLUGIN_SOURCE % 'Brush')
+    write('tools/util.py', TREE_PLUGIN_SOURCE % 'ToolUtil')
+    write('tools/brush_test.py', TREE_PLUGIN_SOURCE % 'BrushTest')
+    write('other/deeper/util.py', TREE_PLUGIN_SOURCE % 'OtherUtil')
+    write('tests/test_all.py', TREE_PLUGIN_SOURCE % 'Tests')
+    write('not-a-package/stray.py', TREE_PLUGIN_SOURCE % 'Stray')
+
+    listed = []
+    list_dir = search._list_dir
+    def counting_list_dir(path):
+        listed.append(path)
+        return list_dir(path)
+    search._list_dir = counting_list_dir
+    try:
+        search.find_plugins_in_tree(root, package='giblets_tree_test', 
+                                    exclude=['tests', '*_test.py'])
+        assert found() == ['giblets_tree_test.other.deeper.util.OtherUtil',
+                           'giblets_tree_test.tools.brush.Brush',
+                           'giblets_tree_test.tools.util.ToolUtil',
+                           'giblets_tree_test.top.Top']
+        assert sys.modules['giblets_tree_test.tools'].brush.SIZE == 3
+        assert len(listed) == 4
+
+        # unchanged directories are not listed again
+        del listed[:]
+        search.find_plugins_in_tree(root, package='giblets_tree_test', 
+                                    exclude=['tests', '*_test.py'])
+        assert listed == []
+
+        # new files turn up once their directory changes
+        write('other/deeper/more.py', TREE_PLUGIN_SOURCE % 'More')
+        os.utime(os.path.join(root, 'other', 'deeper'), (1000000000, 1000000000))
+        search.find_plugins_in_tree(root, package='giblets_tree_test', 
+                                    exclude=['tests', '*_test.py'])
+        assert listed == [os.path.join(root, 'other', 'deeper')]
+        assert 'giblets_tree_test.other.deeper.more.More' in found()
+    finally:
+        search._list_dir = list_dir
+        for module_name in list(sys.modules):
+            if module_name.startswith('giblets_tree_test'):
+                unregister(module_name)
+                del sys.modules[module_name]
+        shutil.rmtree(root)
+
+def test_tree_symlink_loop():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets.core import ComponentManager, unregister
+    from giblets.search import find_plugins_in_tree
+
+    root = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(root, 'tools'))
+        f = open(os.path.join(root, 'tools', 'brush.py'), 'w')
+        f.write(TREE_PLUGIN_SOURCE % 'LoopBrush')
+        f.close()
+        # a link back up the tree, and a second way into tools
+        os.symlink(root, os.path.join(root, 'tools', 'loop'))
+        os.symlink(os.path.join(root, 'tools'), os.path.join(root, 'zz_tools'))
+
+        find_plugins_in_tree(root, package='giblets_loop_test')
+        found = ['%s.%s' % (p.__class__.__module__, p.__class__.__name__)
+                 for p in ComponentManager().get_all(TestTreeInterface)
+                 if p.__class__.__module__.startswith('giblets_loop_test')]
+        assert found == ['giblets_loop_test.tools.brush.LoopBrush']
+    finally:
+        for module_name in list(sys.modules):
+            if module_name.startswith('giblets_loop_test'):
+                unregister(module_name)
+                del sys.modules[module_name]
+        shutil.rmtree(root)
+
+class TestBundleInterface(ExtensionInterface):
+    pass
+
+BUNDLE_PLUGIN_SOURCE = """
+from giblets.core import Component, implements
+from tests.test_search import TestBundleInterface
+
+class BundlePlugin%s(Component):
+    implements(TestBundleInterface)
+    version = %d
+"""
+
+def test_load_from_bundle():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets.core import ComponentManager, unregister
+    from giblets.bundle import build_bundle
+    from giblets.search import find_plugins_in_bundle
+
+    work_dir = tempfile.mkdtemp()
+    plugin_dir = os.path.join(work_dir, 'plugins')
+    bundle = os.path.join(work_dir, 'plugins.zip')
+    os.mkdir(plugin_dir)
+    def write_plugins(version, mtime):
+        for name in ('A', 'B'):
+            f = open(os.path.join(plugin_dir, 'giblets_bundle_test_%s.py' % name.lower()), 'w')
+            f.write(BUNDLE_PLUGIN_SOURCE % (name, version))
+            f.close()
+        assert build_bundle(plugin_dir, bundle) == ['giblets_bundle_test_a', 
+                                                    'giblets_bundle_test_b']
+        os.utime(bundle, (mtime, mtime))
+
+    def found():
+        return [(p.__class__.__name__, p.version) 
+                for p in ComponentManager().get_all(TestBundleInterface)]
+
+    try:
+        umask = os.umask(022)
+        try:
+            write_plugins(1, 1000000000)
+        finally:
+            os.umask(umask)
+        # readable by whoever the bundle is shipped to
+        assert os.stat(bundle).st_mode & 0777 == 0644
+        find_plugins_in_bundle(bundle)
+        assert found() == [('BundlePluginA', 1), ('BundlePluginB', 1)]
+        assert sys.modules['giblets_bundle_test_a'].__file__.startswith(bundle)
+
+        # without reload, changes are ignored
+        write_plugins(2, 1000000010)
+        find_plugins_in_bundle(bundle)
+        assert found() == [('BundlePluginA', 1), ('BundlePluginB', 1)]
+
+        # with reload, the new classes take the place of the old ones
+        find_plugins_in_bundle(bundle, reload=True)
+        assert found() == [('BundlePluginA', 2), ('BundlePluginB', 2)]
+    finally:
+        for module_name in ('giblets_bundle_test_a', 'giblets_bundle_test_b'):
+            unregister(module_name)
+            sys.modules.pop(module_name, None)
+        shutil.rmtree(work_dir)
+
+BATCH_PLUGIN_SOURCE = """
+from giblets import Component, define_components
+from tests.test_search import TestTreeInterface
+define_components([('IterBatchPlugin%d' % i, (Component,), {}, [TestTreeInterface])
+                   for i in range(2)])
+"""
+
+def test_iter_plugins_in_path():
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from giblets.core import unregister
+    from giblets.search import iter_plugins_in_path
+
+    plugin_dir = tempfile.mkdtemp()
+    sources = {'giblets_iter_test_a': TREE_PLUGIN_SOURCE % 'IterPluginA',
+               'giblets_iter_test_b': TREE_PLUGIN_SOURCE % 'IterPluginB' + 
+                                      "\nraise ValueError('broken')\n",
+               'giblets_iter_test_c': BATCH_PLUGIN_SOURCE}
+    try:
+        for module_name, source in sources.items():
+            f = open(os.path.join(plugin_dir, module_name + '.py'), 'w')
+            f.write(source)
+            f.close()
+        discoveries = sorted(iter_plugins_in_path(plugin_dir))
+        assert [d.name for d in discoveries] == ['giblets_iter_test_a', 'giblets_iter_test_b',
+                                                 'giblets_iter_test_c']
+        good, broken, batch = discoveries
+        assert [c.__name__ for c in good.components] == ['IterPluginA']
+        assert good.interfaces == [TestTreeInterface]
+        assert good.error is None and good.elapsed >= 0
+        assert good.source == os.path.join(plugin_dir, 'giblets_iter_test_a.py')
+        assert broken.components == [] and broken.interfaces == []
+        assert 'broken' in broken.error
+        # Components registered together with define_components
+        assert [c.__name__ for c in batch.components] == ['IterBatchPlugin0', 'IterBatchPlugin1']
+        assert batch.interfaces == [TestTreeInterface]
+
+        # loaded modules are skipped, the broken one is tried again
+        assert [d.name for d in iter_plugins_in_path(plugin_dir)] == ['giblets_iter_test_b']
+    finally:
+        for module_name in sources:
+            unregister(module_name)
+            sys.modules.pop(module_name, None)
+        shutil.rmtree(plugin_dir)
+
+class TestStreamInterface(ExtensionInterface):
+    pass
+
+class StreamEntryPoint(FakeEntryPoint):
+    def resolve(self):
+        from giblets.core import Component, implements
+        class Plugin(Component):
+            implements(TestStreamInterface)
+            name = self.name
+        Plugin.__name__ = 'StreamPlugin_%s' % self.name
+        if self.fail:
+            raise ImportError('broken plugin')
+
+def test_iter_plugins_by_entry_point():
+    from giblets.core import ComponentManager
+    from giblets.search import iter_plugins_by_entry_point
+
+    def names():
+        return [p.name for p in ComponentManager().get_all(TestStreamInterface)]
+
+    ws = FakeWorkingSet([StreamEntryPoint('first'),
+                         StreamEntryPoint('broken', fail=True),
+                         StreamEntryPoint('unresolved', missing=True),
+                         StreamEntryPoint('second')])
+    seen = []
+    for discovery in iter_plugins_by_entry_point('giblets_stream_test', ws):
+        # components are registered by the time their discovery is seen
+        seen.append((discovery.name, [c.name for c in discovery.components], 
+                     discovery.error is None))
+        for component in discovery.components:
+            assert component.name in names()
+    assert seen == [('first', ['first'], True), ('broken', [], False), 
+                    ('unresolved', [], False), ('second', ['second'], True)]
+    assert names() == ['first', 'second']
+
+    # stopping early leaves the rest unloaded
+    ws = FakeWorkingSet([StreamEntryPoint('third'), StreamEntryPoint('fourth')])
+    for discovery in iter_plugins_by_entry_point('giblets_stream_test', ws):
+        assert discovery.name == 'third'
+        break
+    assert names() == ['first', 'second', 'third']
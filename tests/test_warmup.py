@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2009-2010 Luke Tucker
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+#
+# Author: Luke Tucker <voxluci@gmail.com>
+#
+from helpers import *
+
+def test_usage_profile():
+    clear_registry()
+    import os
+    import tempfile
+    from giblets import Component, ComponentManager, ExtensionPoint, ExtensionInterface, implements
+    from giblets.policy import Blacklist
+    from giblets.warmup import UsageProfile, warm_up
+
+    class IHandler(ExtensionInterface):
+        pass
+
+    class Router(Component):
+        handlers = ExtensionPoint(IHandler)
+
+    class Index(Component):
+        implements(IHandler)
+
+    class Admin(Component):
+        implements(IHandler)
+
+    class Rarely(Component):
+        pass
+
+    class Never(Component):
+        pass
+
+    mgr = ComponentManager()
+    profile = UsageProfile()
+    mgr.record_usage(profile)
+    router = Router(mgr)
+    for i in range(3):
+        router.handlers
+    Rarely(mgr)
+    mgr.record_usage(None)
+    router.handlers
+
+    assert profile.activations == ['tests.test_warmup.Router', 
+                                   'tests.test_warmup.Index', 
+                                   'tests.test_warmup.Admin', 
+                                   'tests.test_warmup.Rarely']
+    assert profile.accesses['tests.test_warmup.Router'] == 1
+    assert profile.accesses['tests.test_warmup.Index'] == 3
+    assert profile.accesses['tests.test_warmup.Rarely'] == 1
+    assert profile.hot(min_accesses=2) == ['tests.test_warmup.Index', 
+                                           'tests.test_warmup.Admin']
+    assert profile.hot(limit=1, min_accesses=2) == ['tests.test_warmup.Index']
+
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        profile.save(filename)
+
+        mgr = ComponentManager()
+        blacklist = Blacklist()
+        blacklist.disable_component(Admin)
+        mgr.restrict(blacklist)
+        activated = warm_up(mgr, filename)
+        assert [c.__class__ for c in activated] == [Router, Index, Rarely]
+        assert Never not in mgr
+
+        mgr = ComponentManager()
+        thread = warm_up(mgr, UsageProfile.load(filename), min_accesses=2, background=True)
+        thread.join()
+        assert Index in mgr
+        assert Admin in mgr
+        assert Router not in mgr
+    finally:
+        os.remove(filename)